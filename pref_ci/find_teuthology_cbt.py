@@ -3,11 +3,18 @@ import re
 import json
 import yaml
 import fnmatch
+import time
+import queue
+import sqlite3
 import datetime
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Generator, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Generator, List, Optional, Set, Tuple
 
 # -----------------------------------------------------------------------------
 # CONFIGURABLE CONSTANTS                                                         
@@ -16,6 +23,17 @@ ROOT_DIR = "/a"
 FILE_PATTERN = "json_output.*.smithi*.front.sepia.ceph.com"
 MAX_WORKERS = 32
 LIMIT = None  # None -> process everything
+CONFIG_CACHE_SIZE = 1024  # parsed orig.config.yaml files kept in memory
+PERF_CACHE_SIZE = 4096    # per-directory perf_stat totals kept in memory
+# ---- Discovery ---------------------------------------------------------------
+#   • Run directories are walked WALK_WORKERS at a time
+#   • Teuthology copies each node's archive to <job>/remote/<host>/ (CBT
+#     results included); its log directories, named in REMOTE_PRUNE_DIRS,
+#     never hold results and are not entered
+#   • CBT_SINCE=YYYY-MM-DD only walks runs started on or after that day
+WALK_WORKERS = 8
+REMOTE_PRUNE_DIRS = {"log", "coredump", "syslog"}
+SINCE = os.getenv("CBT_SINCE")
 # ---- PostgREST endpoint ------------------------------------------------------
 #   • Override with environment variable POSTGREST_URL if needed
 #   • Default now points to mira118 server (matches your deployment)
@@ -27,41 +45,207 @@ AUTH = (
     os.getenv("POSTGREST_USER", "postgres"),
     os.getenv("POSTGREST_PASS", "root")
 )
+# ---- Bulk upload -------------------------------------------------------------
+#   • Payloads are inserted BATCH_SIZE rows per request (PostgREST takes arrays)
+#   • 5xx answers, timeouts and connection errors are retried UPLOAD_RETRIES
+#     times with exponential backoff starting at UPLOAD_BACKOFF seconds
+BATCH_SIZE = int(os.getenv("POSTGREST_BATCH_SIZE", "500"))
+UPLOAD_RETRIES = 5
+UPLOAD_BACKOFF = 0.5
+UPLOAD_TIMEOUT = 60
+#   • Rows already in the table are skipped (resolution=ignore-duplicates) on
+#     POSTGREST_ON_CONFLICT, a comma separated unique key such as
+#     "job_id,benchmark_mode,seq"; left empty, PostgREST uses the primary key
+ON_CONFLICT = os.getenv("POSTGREST_ON_CONFLICT", "")
+#   • A batch rejected with one of SPLIT_STATUSES (a conflicting or malformed
+#     row fails the whole array) is split until the offending rows are isolated
+SPLIT_STATUSES = (400, 409, 422)
+# ---- Manifest ----------------------------------------------------------------
+#   • SQLite file remembering uploaded results (path + mtime + size) and the
+#     job directories that are fully ingested, which later runs do not walk
+#   • Delete it to re-upload the whole archive
+MANIFEST_PATH = os.path.expanduser(os.getenv("CBT_MANIFEST", "~/.cbt_manifest.sqlite"))
 
 # -----------------------------------------------------------------------------
-# DISCOVERY – fast iterator (stops when LIMIT is reached)                        
+# DISCOVERY – parallel walker (stops when LIMIT is reached)                      
 # -----------------------------------------------------------------------------
 
-def iter_matching_files(root_dir: str, pattern: str, limit: Optional[int] = None) -> Generator[str, None, None]:
-    """Yield file paths whose *filename* matches the given pattern.
-    Traverses the tree with os.walk; stops once *limit* results have been found."""
+JobResults = Tuple[Path, List[str]]
+
+
+def iter_job_results(root_dir: str, pattern: str, limit: Optional[int] = None,
+                     skip_dirs: Optional[Set[str]] = None,
+                     since: Optional[datetime.datetime] = None,
+                     workers: int = WALK_WORKERS) -> Generator[JobResults, None, None]:
+    """Yield (job dir, result files) for every job under *root_dir* whose
+    file names match *pattern*, as soon as each job has been walked.
+    Each run directory (a child of *root_dir*) is walked by one of *workers*
+    threads with os.scandir. Job dirs in *skip_dirs* and the node log
+    directories in REMOTE_PRUNE_DIRS are not entered. With *since*, runs
+    whose name carries an older (or no) timestamp are skipped. Stops once
+    *limit* files were found."""
     compiled = re.compile(fnmatch.translate(pattern))
-    found = 0
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            if compiled.match(filename):
-                yield os.path.join(dirpath, filename)
-                found += 1
-                if limit and found >= limit:
-                    return
+    skip_dirs = skip_dirs or set()
+    if os.path.exists(os.path.join(root_dir, "orig.config.yaml")):
+        units = [root_dir]  # pointed at a single job
+    else:
+        units = []
+        with os.scandir(root_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False) and entry.path not in skip_dirs \
+                        and _run_selected(entry.name, since):
+                    units.append(entry.path)
+    print(f"🗂️  Walking {len(units)} run directories with {workers} threads")
+
+    found: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+    walker_done = object()
+
+    def walk_unit(unit: str):
+        try:
+            _walk_run(unit, compiled, skip_dirs, found.put, stop)
+        except Exception as exc:
+            print(f"⚠️  Failed walking {unit}: {exc}")
+        finally:
+            found.put(walker_done)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="walker")
+    try:
+        for unit in units:
+            pool.submit(walk_unit, unit)
+        pending, count = len(units), 0
+        while pending:
+            item = found.get()
+            if item is walker_done:
+                pending -= 1
+                continue
+            job_dir, paths = item
+            if limit and count + len(paths) >= limit:
+                yield job_dir, paths[:limit - count]
+                return
+            count += len(paths)
+            yield job_dir, paths
+    finally:
+        # on LIMIT or an error in the consumer, let the walkers wind down
+        stop.set()
+        pool.shutdown(wait=True)
+
+
+def _run_selected(name: str, since: Optional[datetime.datetime]) -> bool:
+    if since is None:
+        return True
+    ts = extract_timestamp(name)
+    return ts is not None and ts >= since
+
+
+def _walk_run(top: str, compiled, skip_dirs: Set[str], emit: Callable[[JobResults], None],
+              stop: threading.Event):
+    """Depth-first os.scandir walk of *top*. A directory holding an
+    orig.config.yaml is a job; the matching files of its subtree are
+    emitted together once the subtree is done. Files outside any job
+    are ignored."""
+    def walk(path: str, results: Optional[List[str]]):
+        if stop.is_set():
+            return
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as exc:
+            print(f"⚠️  Cannot list {path}: {exc}")
+            return
+        is_job = any(e.name == "orig.config.yaml" for e in entries)
+        if is_job:
+            results = []
+        # <job>/remote/<host>/: only the node's log directories are skipped
+        node_dir = os.path.basename(os.path.dirname(path)) == "remote"
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if node_dir and entry.name in REMOTE_PRUNE_DIRS:
+                    continue
+                if entry.path not in skip_dirs:
+                    walk(entry.path, results)
+            elif results is not None and compiled.match(entry.name):
+                results.append(entry.path)
+        if is_job and results:
+            emit((Path(path), sorted(results)))
+
+    walk(top, None)
 
 # -----------------------------------------------------------------------------
 # YAML / JSON HELPERS                                                            
 # -----------------------------------------------------------------------------
 
-def get_teuthology_config(start_path: str) -> Optional[dict]:
-    path = Path(start_path)
-    for parent in path.parents:
-        cfg = parent / "orig.config.yaml"
-        if cfg.exists():
+# libyaml's loader parses teuthology configs several times faster
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class LoadOnceCache:
+    """Thread-safe LRU of computed values that computes each key only once.
+    Threads asking for a key that is being computed wait for that result."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[object, Future]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, load: Callable):
+        with self.lock:
+            fut = self.entries.get(key)
+            owner = fut is None
+            if owner:
+                fut = self.entries[key] = Future()
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+        if owner:
             try:
-                return yaml.safe_load(cfg.read_text())
-            except Exception as exc:
-                print(f"⚠️  Failed reading {cfg}: {exc}")
-                return None
+                fut.set_result(load(key))
+            except BaseException as exc:
+                fut.set_exception(exc)
+        return fut.result()
+
+
+_config_cache = LoadOnceCache(CONFIG_CACHE_SIZE)
+
+
+def find_job_dir(start_path: str) -> Optional[Path]:
+    """The nearest parent holding the job's orig.config.yaml."""
+    return _job_dir_of(os.path.dirname(start_path))
+
+
+@lru_cache(maxsize=4096)
+def _job_dir_of(dirpath: str) -> Optional[Path]:
+    # every result directory of a job resolves to the same answer
+    path = Path(dirpath)
+    for candidate in (path, *path.parents):
+        if (candidate / "orig.config.yaml").exists():
+            return candidate
     return None
 
 
+def get_teuthology_config(start_path: str) -> Optional[dict]:
+    job_dir = find_job_dir(start_path)
+    if job_dir is None:
+        return None
+    return load_job_config(job_dir)
+
+
+def load_job_config(job_dir: Path) -> Optional[dict]:
+    """Parsed orig.config.yaml of *job_dir*, read once per job."""
+    return _config_cache.get(job_dir, _read_job_config)
+
+
+def _read_job_config(job_dir: Path) -> Optional[dict]:
+    cfg = job_dir / "orig.config.yaml"
+    try:
+        with open(cfg) as f:
+            return yaml.load(f, Loader=YAML_LOADER)
+    except Exception as exc:
+        print(f"⚠️  Failed reading {cfg}: {exc}")
+        return None
+
+
 def load_json(path: str) -> Optional[dict]:
     try:
         with open(path) as f:
@@ -79,16 +263,63 @@ def extract_timestamp(job_name: str) -> Optional[datetime.datetime]:
     return datetime.datetime.strptime(m[0], "%Y-%m-%d_%H:%M:%S") if m else None
 
 
+# perf stat events summed into the payload (total_cpu_cycles,
+# total_instructions, total_cache_misses); the last two need bigint columns
+# of those names in the cbt_performance table
+PERF_EVENTS = ("cycles", "instructions", "cache-misses")
+
+# "  <not counted>  cycles:u" / "<not supported>  cache-misses"
+_PERF_NOT_COUNTED = re.compile(r"^\s*<not (?:counted|supported)>\s+(\S+)")
+
+_perf_cache = LoadOnceCache(PERF_CACHE_SIZE)
+
+
+def read_perf_totals(testdir: str) -> Dict[str, int]:
+    """Sum of each PERF_EVENTS event over the perf_stat.* files under
+    *testdir*. Computed once per directory and shared by the sibling
+    results in it."""
+    return _perf_cache.get(testdir, _sum_perf_stats)
+
+
 def read_total_cpu_cycles(testdir: str) -> int:
-    total = 0
+    return read_perf_totals(testdir)["cycles"]
+
+
+def _sum_perf_stats(testdir: str) -> Dict[str, int]:
+    totals = dict.fromkeys(PERF_EVENTS, 0)
     for p in Path(testdir).rglob('perf_stat.*'):
-        try:
-            match = re.search(r"(.*) cycles", p.read_text())
-            if match:
-                total += int(match.group(1).replace(',', '').strip())
-        except Exception:
-            continue
-    return total
+        for event, value in _read_perf_stat(p).items():
+            totals[event] += value
+    return totals
+
+
+def _read_perf_stat(path: Path) -> Dict[str, int]:
+    """First count of each PERF_EVENTS event in one `perf stat` output,
+    read line by line ("  1,234,567  cycles:u  # 3.0 GHz"). Counts perf
+    could not take ("<not counted>", "<not supported>") are 0."""
+    counts: Dict[str, int] = {}
+    try:
+        with open(path, errors="replace") as f:
+            for line in f:
+                missing = _PERF_NOT_COUNTED.match(line)
+                if missing:
+                    event, value = missing.group(1), None
+                else:
+                    fields = line.split(None, 2)
+                    if len(fields) < 2:
+                        continue
+                    event, value = fields[1], fields[0]
+                event = event.split(":", 1)[0]
+                if event in PERF_EVENTS and event not in counts:
+                    try:
+                        counts[event] = int(value.replace(",", "")) if value else 0
+                    except ValueError:
+                        counts[event] = 0
+                    if len(counts) == len(PERF_EVENTS):
+                        break
+    except OSError:
+        pass
+    return counts
 
 # -----------------------------------------------------------------------------
 # PAYLOAD BUILD + POSTGREST                                                      
@@ -107,6 +338,7 @@ def build_payload(cfg: dict, bench_json: dict, path: str) -> Optional[dict]:
         path_obj = Path(path)
         seq_match = re.search(r"/json_output\.(\d+)", path)
         benchmark_mode = path_obj.parent.name if path_obj.parent.name in {"rand", "write", "seq"} else "fio"
+        perf = read_perf_totals(os.path.dirname(path))
 
         return {
             "job_id": cfg["job_id"],
@@ -118,7 +350,9 @@ def build_payload(cfg: dict, bench_json: dict, path: str) -> Optional[dict]:
             "machine_type": cfg.get("machine_type"),
             "benchmark_mode": benchmark_mode,
             "seq": int(seq_match.group(1)) if seq_match else 0,
-            "total_cpu_cycles": read_total_cpu_cycles(os.path.dirname(path)),
+            "total_cpu_cycles": perf["cycles"],
+            "total_instructions": perf["instructions"],
+            "total_cache_misses": perf["cache-misses"],
             "benchmark": cbt_task.get("benchmarks"),
             "results": bench_json.get("results")
         }
@@ -127,48 +361,261 @@ def build_payload(cfg: dict, bench_json: dict, path: str) -> Optional[dict]:
         return None
 
 
-def send_payload(payload: dict):
-    try:
-        r = requests.post(POSTGREST_URL, json=payload, auth=AUTH, timeout=10)
-        if r.status_code != 201:
-            print(f"❌ Insert failed ({r.status_code}): {r.text} -> {payload['job_id']}")
-    except requests.exceptions.RequestException as exc:
-        print(f"❌ HTTP error: {exc}")
+class BulkUploader:
+    """Collects payloads from the worker threads and inserts them in bulk.
+
+    A single uploader thread drains a bounded queue (workers block when it is
+    full) and POSTs JSON arrays of *batch_size* rows over one pooled session.
+    5xx answers, timeouts and connection errors are retried with backoff.
+    Duplicates of the conflict key are ignored by PostgREST. A 409 (a row
+    conflicting on another unique key), 400 or 422 (a row the table rejects)
+    splits the batch in halves until the offending rows are isolated, so they
+    do not lose the rest; only those rows count as failed. *on_done* callbacks passed to add()
+    run on the uploader thread once their row is in the table, whether this
+    run inserted it or it was there already."""
+
+    _STOP = object()
+
+    def __init__(self, url: str = POSTGREST_URL, auth: Tuple[str, str] = AUTH,
+                 batch_size: int = BATCH_SIZE, retries: int = UPLOAD_RETRIES,
+                 backoff: float = UPLOAD_BACKOFF, timeout: float = UPLOAD_TIMEOUT,
+                 on_conflict: str = ON_CONFLICT):
+        self.url = url
+        self.params = {"on_conflict": on_conflict} if on_conflict else None
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update({"Prefer": "return=minimal,resolution=ignore-duplicates"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=self.batch_size * 4)
+        self.sent = self.duplicates = self.failed = self.requests = 0
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+        self.thread.start()
+
+    def add(self, payload: dict, on_done: Optional[Callable[[], None]] = None):
+        self.queue.put((payload, on_done))
+
+    def close(self):
+        """Send what is left, stop the uploader thread and print the rate."""
+        self.queue.put(self._STOP)
+        self.thread.join()
+        self.session.close()
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        print(f"📤 Uploaded {self.sent} rows in {self.requests} requests, "
+              f"{self.duplicates} already present, {self.failed} failed, "
+              f"{elapsed:.1f}s ({self.sent / elapsed:.1f} rows/s)")
+
+    def _run(self):
+        batch: List[Tuple[dict, Optional[Callable[[], None]]]] = []
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._send(batch)
+                batch = []
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        status, text = self._post([payload for payload, _ in batch])
+        if status == 201:
+            self.sent += len(batch)
+            self._done(batch)
+        elif status in SPLIT_STATUSES and len(batch) > 1:
+            # a bulk insert is all-or-nothing; narrow down the offending rows
+            half = len(batch) // 2
+            self._send(batch[:half])
+            self._send(batch[half:])
+        elif status == 409:
+            # the row is already in the table, i.e. ingested by an earlier run
+            self.duplicates += 1
+            self._done(batch)
+        else:
+            self.failed += len(batch)
+            job_ids = sorted({str(payload.get("job_id")) for payload, _ in batch})
+            print(f"❌ Insert failed ({status}): {text[:200]} -> {', '.join(job_ids[:10])}")
+
+    def _done(self, batch):
+        for _, on_done in batch:
+            if on_done:
+                try:
+                    on_done()
+                except Exception as exc:
+                    print(f"⚠️  Upload callback failed: {exc}")
+
+    def _post(self, rows: List[dict]) -> Tuple[int, str]:
+        """POST *rows*, retrying transient failures; returns (status, body)."""
+        for attempt in range(self.retries + 1):
+            try:
+                self.requests += 1
+                r = self.session.post(self.url, json=rows, params=self.params, timeout=self.timeout)
+                if r.status_code < 500 or attempt == self.retries:
+                    return r.status_code, r.text
+                reason = f"HTTP {r.status_code}"
+            except requests.exceptions.RequestException as exc:
+                if attempt == self.retries:
+                    return 0, str(exc)
+                reason = str(exc)
+            delay = self.backoff * (2 ** attempt)
+            print(f"⚠️  Upload retry {attempt + 1}/{self.retries} in {delay:.1f}s ({reason})")
+            time.sleep(delay)
+        return 0, "no attempts"
+
+# -----------------------------------------------------------------------------
+# MANIFEST OF INGESTED RESULTS                                                   
+# -----------------------------------------------------------------------------
+
+class Manifest:
+    """Local record of what earlier runs already ingested.
+
+    A result file is done once its row is in the table (inserted now or
+    rejected as a duplicate of an earlier upload) or it turned out to hold
+    no benchmark result; it is skipped while its mtime and size stay
+    the same. A job directory is complete once teuthology wrote its
+    summary.yaml (the job finished) and every result file under it is done;
+    complete jobs are pruned from the walk. All methods are thread-safe."""
+
+    FLUSH_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_dir TEXT PRIMARY KEY, completed_at TEXT NOT NULL);
+        """)
+        self.lock = threading.Lock()
+        self.files: Dict[str, Tuple[float, int]] = {
+            path: (mtime, size) for path, mtime, size in self.conn.execute("SELECT path, mtime, size FROM files")}
+        self.completed_jobs: Set[str] = {row[0] for row in self.conn.execute("SELECT job_dir FROM jobs")}
+        self.unflushed: List[Tuple[str, float, int]] = []
+        # per job dir seen this run: result files not done yet
+        self.outstanding: Dict[str, int] = {}
+        self.skipped = 0
+
+    def begin(self, job_dir: str, path: str, st: os.stat_result) -> bool:
+        """Count *path* towards its job; False if it was already ingested."""
+        with self.lock:
+            self.outstanding.setdefault(job_dir, 0)
+            if self.files.get(path) == (st.st_mtime, st.st_size):
+                self.skipped += 1
+                return False
+            self.outstanding[job_dir] += 1
+            return True
+
+    def done(self, job_dir: str, path: str, st: os.stat_result):
+        with self.lock:
+            self.outstanding[job_dir] -= 1
+            self.files[path] = (st.st_mtime, st.st_size)
+            self.unflushed.append((path, st.st_mtime, st.st_size))
+            if len(self.unflushed) >= self.FLUSH_EVERY:
+                self._flush()
+
+    def close(self, walk_complete: bool = True):
+        """Persist the done files and, after a full walk, the completed jobs."""
+        with self.lock:
+            self._flush()
+            if walk_complete:
+                now = datetime.datetime.now().isoformat(timespec="seconds")
+                completed = [
+                    (job_dir, now) for job_dir, left in self.outstanding.items()
+                    if left == 0 and os.path.exists(os.path.join(job_dir, "summary.yaml"))
+                ]
+                self.conn.executemany("INSERT OR IGNORE INTO jobs VALUES (?, ?)", completed)
+                self.conn.commit()
+                print(f"🗂️  Manifest: {self.skipped} files already uploaded, "
+                      f"{len(completed)} jobs completed, {len(self.completed_jobs)} pruned")
+            self.conn.close()
+
+    def _flush(self):
+        self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", self.unflushed)
+        self.conn.commit()
+        self.unflushed = []
 
 # -----------------------------------------------------------------------------
 # PROCESS SINGLE FILE                                                            
 # -----------------------------------------------------------------------------
 
-def process_file(path: str):
-    cfg = get_teuthology_config(path)
+def process_job(job_dir: Optional[Path], paths: List[str], uploader: BulkUploader,
+                manifest: Optional[Manifest] = None):
+    if job_dir is None:
+        return
+    for path in paths:
+        try:
+            process_file(path, uploader, manifest, job_dir=job_dir)
+        except Exception as exc:
+            print(f"⚠️  Failed processing {path}: {exc}")
+
+
+def process_file(path: str, uploader: BulkUploader, manifest: Optional[Manifest] = None,
+                 job_dir: Optional[Path] = None):
+    job_dir = job_dir or find_job_dir(path)
+    if job_dir is None:
+        return
+
+    done = None
+    if manifest:
+        st = os.stat(path)
+        if not manifest.begin(str(job_dir), path, st):
+            return
+        done = lambda: manifest.done(str(job_dir), path, st)
+
+    cfg = load_job_config(job_dir)
     if not cfg:
         return
 
     bench_json = load_json(path)
     if not bench_json:
+        # possibly still being written; try again next run
         return
 
     payload = build_payload(cfg, bench_json, path)
     if payload:
-        send_payload(payload)
+        uploader.add(payload, on_done=done)
+    elif done:
+        # no benchmark result in this file; nothing to upload
+        done()
 
 # -----------------------------------------------------------------------------
 # MAIN                                                                           
 # -----------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    print(f"🔍 Scanning {ROOT_DIR} for pattern '{FILE_PATTERN}' (limit={LIMIT}) …")
-    print(f"📡 Using PostgREST endpoint: {POSTGREST_URL}")
+    since = datetime.datetime.strptime(SINCE, "%Y-%m-%d") if SINCE else None
+    print(f"🔍 Scanning {ROOT_DIR} for pattern '{FILE_PATTERN}' (limit={LIMIT}, since={SINCE}) …")
+    print(f"📡 Using PostgREST endpoint: {POSTGREST_URL} (batch size {BATCH_SIZE})")
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
-        futures = []
-        for file_path in iter_matching_files(ROOT_DIR, FILE_PATTERN, LIMIT):
-            futures.append(pool.submit(process_file, file_path))
+    manifest = Manifest(MANIFEST_PATH)
+    uploader = BulkUploader()
+    walked = False
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = []
+            # one task per job, so its config is loaded once for all its results;
+            # jobs are submitted while the walkers are still discovering more
+            jobs = iter_job_results(ROOT_DIR, FILE_PATTERN, LIMIT,
+                                    skip_dirs=manifest.completed_jobs, since=since)
+            for job_dir, paths in jobs:
+                futures.append(pool.submit(process_job, job_dir, paths, uploader, manifest))
 
-        for fut in as_completed(futures):
-            try:
-                fut.result()
-            except Exception as exc:
-                print(f"Unhandled error: {exc}")
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as exc:
+                    print(f"Unhandled error: {exc}")
+        walked = LIMIT is None
+    finally:
+        # callbacks of the last batches mark their files done
+        uploader.close()
+        manifest.close(walk_complete=walked)
 
     print("✅ Done.")
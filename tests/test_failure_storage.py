@@ -0,0 +1,26 @@
+import pytest
+
+from watcher_failure.benchmark import synthetic_records
+from watcher_failure.failure_storage import FailureStorage
+
+
+@pytest.fixture
+def records():
+    return synthetic_records(5000)
+
+
+def _stats(tmp_path, records, ephemeral):
+    storage = FailureStorage(tmp_path / f"{ephemeral}.db", batch_size=700, ephemeral=ephemeral)
+    storage.setup()
+    try:
+        storage.save(records)
+        storage.purge_directories([records[0].directory])
+        storage.save(records[:10])
+        return (storage.fetch_statistics(version="main", top_n=100),
+                storage.fetch_trends(version="main", windows=3, window_days=365 * 10))
+    finally:
+        storage.close()
+
+
+def test_ephemeral_rollup_matches_incremental(tmp_path, records):
+    assert _stats(tmp_path, records, ephemeral=True) == _stats(tmp_path, records, ephemeral=False)
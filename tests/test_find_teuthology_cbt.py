@@ -0,0 +1,57 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[1] / "pref_ci" / "find_teuthology_cbt.py"
+
+
+@pytest.fixture(scope="module")
+def cbt():
+    spec = importlib.util.spec_from_file_location("find_teuthology_cbt", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("status", [400, 409, 422])
+def test_bad_row_does_not_fail_its_batch(cbt, status):
+    uploader = cbt.BulkUploader(url="http://localhost:1/cbt", batch_size=8)
+    uploader.close()
+    uploader.sent = uploader.requests = 0
+    posted = []
+
+    def post(rows):
+        posted.append(len(rows))
+        if any(row["job_id"] == "bad" for row in rows):
+            return status, "rejected"
+        return 201, ""
+
+    uploader._post = post
+    done = []
+    batch = [({"job_id": str(i)}, lambda i=i: done.append(i)) for i in range(7)]
+    batch.insert(3, ({"job_id": "bad"}, lambda: done.append("bad")))
+    uploader._send(batch)
+
+    assert uploader.sent == 7
+    # a 409 row is already in the table, so it is done as well
+    assert set(done) == set(range(7)) | ({"bad"} if status == 409 else set())
+    if status == 409:
+        assert (uploader.duplicates, uploader.failed) == (1, 0)
+    else:
+        assert (uploader.duplicates, uploader.failed) == (0, 1)
+    # bisecting 8 rows down to the bad one takes 2 requests per level
+    assert len(posted) == 1 + 2 * 3
+
+
+def test_read_perf_stat_not_counted(cbt, tmp_path):
+    path = tmp_path / "perf_stat.0"
+    path.write_text(
+        " Performance counter stats for process id '1234':\n"
+        "\n"
+        "     <not counted>      cycles:u\n"
+        "     1,234,567      instructions:u            #    0.00  insn per cycle\n"
+        "   <not supported>      cache-misses\n"
+        "     9,999      cycles\n"
+    )
+    assert cbt._read_perf_stat(path) == {"cycles": 0, "instructions": 1234567, "cache-misses": 0}
@@ -0,0 +1,21 @@
+import pytest
+
+from watcher_failure.issue_index import IssueIndex
+
+
+def test_dump_replaces_atomically(tmp_path):
+    path = tmp_path / "issues.json"
+    IssueIndex.dump([{"id": 1, "subject": "osd crash", "description": ""}], path)
+
+    def failing_sync():
+        yield {"id": 2, "subject": "mon crash", "description": ""}
+        raise RuntimeError("connection reset")
+
+    with pytest.raises(RuntimeError):
+        IssueIndex.dump(failing_sync(), path)
+    # fails halfway through writing the file
+    with pytest.raises(TypeError):
+        IssueIndex.dump([{"id": 2, "subject": "mon crash", "description": object()}], path)
+    # the previous dump is intact and no temp file is left behind
+    assert [issue.id for issue in IssueIndex.load(path).issues] == [1]
+    assert [p.name for p in tmp_path.iterdir()] == ["issues.json"]
@@ -0,0 +1,14 @@
+from watcher_failure.benchmark import _StubConnector
+from watcher_failure.config import Config
+from watcher_failure.report_builder import ReportBuilder
+
+
+def test_trend_lines_without_trends(tmp_path):
+    cfg = Config(db_name=str(tmp_path / "failures.db"), email="", log_directory=str(tmp_path),
+                 days=7, user_name="teuthology", suite_name="rados", branch_name="main",
+                 flavor="default", trend_windows=4)
+    builder = ReportBuilder(cfg, connector=_StubConnector())
+    assert builder._trend_lines({}, indent="  ") == [
+        "Trends (4 windows, oldest → newest):",
+        "  (no failures in the trend range)",
+    ]
@@ -0,0 +1,51 @@
+import logging
+
+import pytest
+
+from watcher_failure import runner as runner_mod
+from watcher_failure.benchmark import _StubConnector, synthetic_archive
+from watcher_failure.config import Config
+from watcher_failure.report_builder import ReportBuilder
+
+
+@pytest.fixture
+def bot_run(tmp_path, monkeypatch):
+    """Run the bot on a 150-run synthetic archive against a cold tracker cache."""
+    synthetic_archive(tmp_path / "archive", runs=150, failures=200, days=7)
+    connector = _StubConnector()
+    monkeypatch.setattr(ReportBuilder, "_connect", lambda self, cfg: connector)
+    needed = set()
+    prefetch = ReportBuilder._prefetch_issues
+
+    def spy(self, reasons):
+        reasons = list(reasons)
+        needed.update(reasons)
+        return prefetch(self, reasons)
+
+    monkeypatch.setattr(ReportBuilder, "_prefetch_issues", spy)
+
+    def run(error_message=None):
+        cfg = Config(db_name=str(tmp_path / "failures.db"), email="",
+                     log_directory=str(tmp_path / "archive"), days=7,
+                     user_name="teuthology", suite_name="rados", branch_name="main",
+                     flavor="default", bot=True, error_message=error_message)
+        cfg.output_dir = str(tmp_path)
+        logging.disable(logging.INFO)
+        try:
+            runner_mod.Runner(cfg).run()
+        finally:
+            logging.disable(logging.NOTSET)
+        return connector.stats["searches"], len(needed)
+
+    return run
+
+
+def test_speculation_bounded_on_cold_cache(bot_run):
+    searches, needed = bot_run()
+    assert needed
+    assert needed <= searches <= needed * 3 // 2
+
+
+def test_no_speculation_with_error_message(bot_run):
+    searches, needed = bot_run(error_message="osd")
+    assert searches == needed
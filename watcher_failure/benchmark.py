@@ -0,0 +1,503 @@
+"""
+Micro-benchmarks for watcher_failure hot paths.
+
+Run with e.g.::
+
+    python -m watcher_failure.benchmark storage --records 200000
+    python -m watcher_failure.benchmark archive --runs 500 --memory --json before.json
+
+``archive`` generates a synthetic teuthology archive and times every stage
+of a bot run against it, so results can be compared run over run.
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from . import normalize
+from .config import Config
+from .failure_scanner import FailureRecord, LogParser, RecordBatch
+from .failure_storage import FailureStorage
+from .reason_matcher import ReasonMatcher
+from .report_builder import ReportBuilder
+from .scan_scrapy_directories import discover_scrapy_directories
+
+
+def synthetic_records(count: int, seed: int = 0) -> List[FailureRecord]:
+    """Build `count` FailureRecords with a realistic spread of reasons."""
+    rng = random.Random(seed)
+    versions = ['quincy', 'squid', 'main', 'reef', 'tentacle']
+    reasons = [
+        f"Command failed on smithi000 with status {i}: 'sudo ceph osd pool create pool{i}'"
+        for i in range(50)
+    ]
+    return [
+        FailureRecord(
+            directory=f"/a/teuthology-2025-05-{1 + i % 28:02d}_01:00:00-rados-distro-default-smithi",
+            date=f"2025-05-{1 + i % 28:02d}",
+            reason=rng.choice(reasons),
+            job_id=str(7000000 + i),
+            version=rng.choice(versions),
+            flavor='default',
+        )
+        for i in range(count)
+    ]
+
+
+def _timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def _legacy_save(storage: FailureStorage, records: List[FailureRecord]) -> None:
+    # what FailureStorage.save did before batching: one execute() per record,
+    # against the same schema and indexes the batched path writes to
+    cur = storage.conn.cursor()
+    for rec in records:
+        cur.execute(
+            "INSERT INTO failures (directory, version, flavor, date, reason, job_id, template_id)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rec.directory, rec.version, rec.flavor, rec.date, rec.reason, rec.job_id, rec.template_id),
+        )
+    storage.conn.commit()
+
+
+def bench_storage(count: int, batch_size: int) -> Dict[str, float]:
+    """
+    Return records/second for the row-by-row and the batched save path, both
+    into an ephemeral FailureStorage, and for building its failure_daily
+    rollup afterwards (which neither save path includes).
+    """
+    records = synthetic_records(count)
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_storage = FailureStorage(Path(tmp) / "legacy.db", ephemeral=True)
+        legacy_storage.setup()
+        legacy = _timed(lambda: _legacy_save(legacy_storage, records))
+        legacy_storage.close()
+        results["row-by-row"] = count / legacy
+
+        storage = FailureStorage(Path(tmp) / "bulk.db", batch_size=batch_size, ephemeral=True)
+        storage.setup()
+        bulk = _timed(lambda: storage.save(records))
+        results[f"executemany (batch={batch_size})"] = count / bulk
+        rollup = _timed(storage._refresh_rollup)
+        storage.close()
+        results["failure_daily rollup build"] = count / rollup
+    return results
+
+
+def bench_statistics(count: int, repeat: int = 20) -> Dict[str, float]:
+    """Return queries/second for top-N over the raw table and over the rollup."""
+    records = synthetic_records(count)
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = FailureStorage(Path(tmp) / "stats.db", ephemeral=True)
+        storage.setup()
+        storage.save(records)
+        cur = storage.conn.cursor()
+        # both sides filter on version, flavor and a window covering the
+        # second half of the synthetic month (2025-05-15 onwards)
+        since_days = (datetime.date.today() - datetime.date(2025, 5, 15)).days
+
+        def raw_query():
+            # the query fetch_statistics ran before the failure_daily rollup
+            return cur.execute(
+                "SELECT reason, COUNT(*) FROM failures WHERE version = ? AND flavor = ?"
+                " AND date >= date('now', ?) GROUP BY reason ORDER BY COUNT(*) DESC LIMIT 10",
+                ("main", "default", f"-{since_days} days"),
+            ).fetchall()
+
+        def rollup_query() -> Dict[str, int]:
+            return storage.fetch_statistics(
+                version="main", flavor="default", since_days=since_days, top_n=10)
+
+        if dict(raw_query()) != rollup_query():
+            raise AssertionError("raw and rollup statistics disagree")
+
+        def raw_scan() -> None:
+            for _ in range(repeat):
+                raw_query()
+
+        def rollup() -> None:
+            for _ in range(repeat):
+                rollup_query()
+
+        results["GROUP BY over failures"] = repeat / _timed(raw_scan)
+        results["failure_daily rollup"] = repeat / _timed(rollup)
+        storage.close()
+    return results
+
+
+def synthetic_scrape_log(path: Path, failures: int, distinct: int = 300, seed: int = 0) -> None:
+    """Write a scrape.log with `failures` entries drawn from `distinct` reasons."""
+    rng = random.Random(seed)
+    reasons = [
+        f"\"2025-05-18T23:34:37.133870+0000 mon.smithi{i:03d} (mon.0) {i} : cluster [WRN] "
+        f"Health check failed: {i} osds down (OSD_DOWN)\" in cluster log"
+        for i in range(distinct)
+    ]
+    with open(path, "w") as fh:
+        for _ in range(failures):
+            kind = rng.choice(["Failure: ", "Timeout: ", "Dead: "])
+            fh.write(kind + rng.choice(reasons) + "\n")
+            fh.write(" ".join(str(rng.randint(7000000, 7999999)) for _ in range(3)) + "\n")
+
+
+def _legacy_normalize_machine_name(log_string: str) -> str:
+    # uncompiled, uncached version LogParser used before normalize.py
+    s = re.sub(r'smithi\d+', 'smithi000', log_string)
+    s = re.sub(r'CEPH_REF=[a-f0-9]+', 'CEPH_REF=XXXXXXXXXXXXXXXXXX', s)
+    return s
+
+
+def _legacy_normalize_for_search(reason: str) -> str:
+    # uncompiled, uncached version RedmineConnector used before normalize.py
+    reason = reason.strip().lstrip("'\"").rstrip("'\"")
+    reason = re.sub(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9:.+-]+\s+", "", reason)
+    reason = re.sub(r"\b(?:osd|mon|mgr|mds)\.[A-Za-z0-9_-]+\b", "", reason)
+    reason = re.sub(r"[(){}]", "", reason)
+    reason = re.sub(r"[()@:;\\\[\\]]", " ", reason)
+    return re.sub(r"\s+", " ", reason).strip()
+
+
+def bench_normalize(failures: int) -> Dict[str, float]:
+    """Return failure lines/second through the old and the cached pipelines."""
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = Path(tmp) / "scrape.log"
+        synthetic_scrape_log(log_path, failures)
+        lines = [
+            line.split(": ", 1)[1]
+            for line in log_path.read_text().splitlines()
+            if line.startswith(("Failure", "Timeout", "Dead"))
+        ]
+
+        def legacy() -> None:
+            for line in lines:
+                _legacy_normalize_for_search(
+                    normalize.convert_reason(_legacy_normalize_machine_name(line)))
+
+        def cached() -> None:
+            for line in lines:
+                normalize.normalize_for_search(normalize.canonical_reason(line))
+
+        normalize.canonical_reason.cache_clear()
+        normalize.normalize_for_search.cache_clear()
+        results["re.sub per call"] = len(lines) / _timed(legacy)
+        results["precompiled + lru_cache"] = len(lines) / _timed(cached)
+        results["LogParser.parse_file"] = len(lines) / _timed(
+            lambda: LogParser().parse_file(log_path))
+    return results
+
+
+def bench_conversion(rules: int, failures: int) -> Dict[str, float]:
+    """Return reasons/second through a per-rule loop and through ReasonMatcher."""
+    rng = random.Random(0)
+    prefixes = {f"Command failed (workunit test rados/test_{i}.sh)": f"short-p{i}" for i in range(rules)}
+    substrings = {f"osd.{i} has slow ops": f"short-s{i}" for i in range(rules)}
+    reasons = [
+        rng.choice([
+            f"Command failed (workunit test rados/test_{rng.randrange(rules * 2)}.sh) on smithi000 with status 1",
+            f"\"2025-05-18T23:34:37.133870+0000 osd.{rng.randrange(rules * 2)} has slow ops\" in cluster log",
+        ])
+        for _ in range(failures)
+    ]
+
+    def per_rule() -> None:
+        for reason in reasons:
+            for prefix in prefixes:
+                if reason.startswith(prefix):
+                    break
+            else:
+                for sub in substrings:
+                    if sub in reason:
+                        break
+
+    matcher = ReasonMatcher({}, prefixes, substrings)
+    return {
+        "startswith / in per rule": failures / _timed(per_rule),
+        "trie + Aho-Corasick": failures / _timed(lambda: [matcher.convert(r) for r in reasons]),
+    }
+
+
+ARCHIVE_USERS = ['teuthology', 'yuriw', 'skanta']
+ARCHIVE_VERSIONS = ['main', 'squid', 'reef', 'quincy', 'tentacle']
+ARCHIVE_SUITE = 'rados'
+
+
+def synthetic_reasons(distinct: int, seed: int = 0) -> List[str]:
+    """`distinct` failure messages shaped like the ones teuthology reports."""
+    rng = random.Random(seed)
+    shapes = [
+        "Command failed on smithi{host:03d} with status {n}: 'sudo ceph osd pool create pool{i} {n}'",
+        "Command failed (workunit test rados/test_{i}.sh) on smithi{host:03d} with status 1: "
+        "'mkdir -p -- /home/ubuntu/cephtest/mnt.0/client.0/tmp && cd /home/ubuntu/cephtest/mnt.0/client.0/tmp "
+        "&& CEPH_CLI_TEST_DUP_COMMAND=1 CEPH_REF={sha} TESTDIR=\"/home/ubuntu/cephtest\" "
+        "adjust-ulimits ceph-coverage timeout 3h /home/ubuntu/cephtest/clone.client.0/qa/workunits/rados/test_{i}.sh'",
+        "\"2025-05-18T23:34:37.133870+0000 mon.smithi{host:03d} (mon.0) {n} : cluster [WRN] "
+        "Health check failed: {i} osds down (OSD_DOWN)\" in cluster log",
+        "SELinux denials found on ubuntu@smithi{host:03d}.front.sepia.ceph.com: "
+        "['type=AVC msg=audit(1747612345.{n}:{i}): avc: denied {{ read }} for pid={n} comm=\"rhsmcertd-worke\"']",
+        "Error reimaging machines: Expected smithi{host:03d}'s OS to be ubuntu 22.04 but found centos {i}",
+        "timed out waiting for admin_socket to appear after osd.{i} restart",
+    ]
+    return [
+        rng.choice(shapes).format(
+            i=i, host=rng.randrange(200), n=rng.randrange(1, 10000), sha=f"{rng.getrandbits(160):040x}")
+        for i in range(distinct)
+    ]
+
+
+def synthetic_archive(
+    root: Path,
+    runs: int,
+    failures: int = 200,
+    days: int = 7,
+    distinct: int = 400,
+    seed: int = 0,
+) -> int:
+    """
+    Write `runs` run directories under `root`, named the way
+    scan_scrapy_directories expects and spread over the last `days` days,
+    each with a scrape.log of about `failures` failures (log-normally
+    distributed, so a few runs are much larger). Reasons follow a Zipf-like
+    distribution over `distinct` messages. Returns the bytes written.
+    """
+    rng = random.Random(seed)
+    reasons = synthetic_reasons(distinct, seed)
+    weights = [1.0 / (rank + 1) for rank in range(distinct)]
+    today = datetime.date.today()
+    root.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for i in range(runs):
+        day = today - datetime.timedelta(days=i % max(1, days))
+        version = ARCHIVE_VERSIONS[i % len(ARCHIVE_VERSIONS)]
+        version_part = '' if version == 'main' else f'-{version}'
+        stamp = f"{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+        run_dir = root / (f"{ARCHIVE_USERS[i % len(ARCHIVE_USERS)]}-{day}_{stamp}-"
+                          f"{ARCHIVE_SUITE}{version_part}-distro-default-smithi")
+        run_dir.mkdir(exist_ok=True)
+        lines = []
+        for _ in range(max(1, int(rng.lognormvariate(math.log(failures), 0.75)))):
+            kind = rng.choices(["Failure: ", "Timeout: ", "Dead: "], [8, 1, 1])[0]
+            lines.append(kind + rng.choices(reasons, weights)[0])
+            jobs = [str(rng.randint(7000000, 8999999)) for _ in range(rng.randint(1, 8))]
+            lines.append(f"{len(jobs)} jobs: {jobs}")
+            if rng.random() < 0.01:
+                lines.append("MAX_BACKTRACE_LINES hit, backtrace truncated")
+        text = "\n".join(lines) + "\n"
+        (run_dir / "scrape.log").write_text(text)
+        written += len(text)
+    return written
+
+
+class _StubConnector:
+    """Stands in for RedmineConnector: no network, a fixed latency per search."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def lookup_cached(self, search_string: str, *, count: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self.cache.get(search_string)
+            if count:
+                self.stats["cache_hits" if hit is not None else "cache_misses"] += 1
+            return hit
+
+    def search_and_refine(self, search_string: str, **_: Any) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        issue_id = 10000 + zlib.crc32(search_string.encode()) % 90000
+        result = {"issue_id": issue_id, "link": f"https://tracker.ceph.com/issues/{issue_id}"}
+        with self._lock:
+            self.stats["searches"] += 1
+            self.cache[search_string] = result
+        return result
+
+    def flush(self) -> None:
+        pass
+
+
+class _Stages:
+    """Times named stages and, if asked, their tracemalloc peak."""
+
+    def __init__(self, trace_memory: bool) -> None:
+        self.trace_memory = trace_memory
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str, unit: str) -> Iterator[Dict[str, Any]]:
+        entry: Dict[str, Any] = {"count": 0, "unit": unit}
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = time.perf_counter() - start
+            if self.trace_memory:
+                entry["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            entry["rate"] = entry["count"] / entry["seconds"] if entry["seconds"] else 0.0
+            self.results[name] = entry
+
+
+def bench_archive(
+    root: Path,
+    days: int = 7,
+    tracker_latency: float = 0.0,
+    trace_memory: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Time the stages of a bot run over the archive at `root`: directory
+    discovery, LogParser.parse_batch, FailureStorage.save,
+    fetch_statistics and ReportBuilder.build with a stubbed tracker.
+    """
+    stages = _Stages(trace_memory)
+    flavors = {'default': (ARCHIVE_USERS, ARCHIVE_SUITE)}
+
+    with stages.stage("discovery", "dirs/s") as st:
+        grouped = discover_scrapy_directories(str(root), days, ARCHIVE_VERSIONS, flavors)
+        st["count"] = sum(len(dirs) for flavor_map in grouped.values() for dirs in flavor_map.values())
+
+    records = RecordBatch()
+    with stages.stage("parse", "records/s") as st:
+        parser = LogParser()
+        st["bytes"] = 0
+        for version, flavor_map in grouped.items():
+            for flavor, dirs in flavor_map.items():
+                for d in dirs:
+                    log_path = Path(d) / "scrape.log"
+                    st["bytes"] += log_path.stat().st_size
+                    batch = parser.parse_batch(log_path)
+                    batch.fill('version', version)
+                    batch.fill('flavor', flavor)
+                    records.extend(batch)
+        st["count"] = len(records)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = FailureStorage(Path(tmp) / "bench.db", ephemeral=True)
+        storage.setup()
+        with stages.stage("save", "records/s") as st:
+            st["count"] = storage.save(records)
+
+        stats_by_vf: Dict[str, Dict[str, Dict[str, int]]] = {}
+        with stages.stage("statistics", "queries/s") as st:
+            for version, flavor_map in grouped.items():
+                stats_by_vf[version] = {}
+                for flavor in flavor_map:
+                    stats_by_vf[version][flavor] = storage.fetch_statistics(
+                        version=version, flavor=flavor, since_days=days, top_n=10)
+                    st["count"] += 1
+        storage.close()
+
+    cfg = Config(
+        db_name=":memory:", email="", log_directory=str(root), days=days,
+        user_name=ARCHIVE_USERS[0], suite_name=ARCHIVE_SUITE, branch_name="main",
+        flavor="default", bot=True,
+    )
+    cfg.versions = ARCHIVE_VERSIONS
+    connector = _StubConnector(tracker_latency)
+    builder = ReportBuilder(cfg, connector=connector)
+    with stages.stage("report", "lookups/s") as st:
+        builder.build(stats_by_vf, grouped, records)
+        st["count"] = connector.stats["searches"]
+    return stages.results
+
+
+def _report_stages(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"  {'stage':<12} {'seconds':>9} {'rate':>16} {'unit':<10} {'peak MiB':>9}")
+    for name, st in results.items():
+        peak = f"{st['peak_bytes'] / 2**20:9.1f}" if "peak_bytes" in st else f"{'-':>9}"
+        print(f"  {name:<12} {st['seconds']:>9.3f} {st['rate']:>16,.0f} {st['unit']:<10} {peak}")
+    parse = results.get("parse")
+    if parse and parse["seconds"]:
+        print(f"  parse read {parse.get('bytes', 0) / 2**20 / parse['seconds']:,.1f} MiB/s")
+
+
+def _report(title: str, results: Dict[str, float], unit: str) -> None:
+    print(title)
+    for name, rate in results.items():
+        print(f"  {name:<32} {rate:>14,.0f} {unit}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="watcher_failure micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    storage = sub.add_parser("storage", help="FailureStorage.save throughput")
+    storage.add_argument("--records", type=int, default=100000)
+    storage.add_argument("--batch_size", type=int, default=5000)
+
+    stats = sub.add_parser("statistics", help="fetch_statistics query rate")
+    stats.add_argument("--records", type=int, default=500000)
+
+    norm = sub.add_parser("normalize", help="failure-string normalization rate")
+    norm.add_argument("--failures", type=int, default=200000)
+
+    conv = sub.add_parser("conversion", help="reason_conversion rule matching rate")
+    conv.add_argument("--rules", type=int, default=500)
+    conv.add_argument("--failures", type=int, default=50000)
+
+    archive = sub.add_parser("archive", help="all bot-run stages over a synthetic archive")
+    archive.add_argument("--runs", type=int, default=300, help="run directories to generate")
+    archive.add_argument("--failures", type=int, default=200, help="median failures per scrape.log")
+    archive.add_argument("--days", type=int, default=7)
+    archive.add_argument("--archive", type=Path, default=None,
+                         help="generate the archive here, or reuse it if it exists (default: a temp dir)")
+    archive.add_argument("--tracker_latency", type=float, default=0.0,
+                         help="seconds each stubbed tracker search takes")
+    archive.add_argument("--memory", action="store_true",
+                         help="also record each stage's tracemalloc peak (slows every stage down)")
+    archive.add_argument("--json", type=Path, default=None, help="write the results to this file")
+
+    args = parser.parse_args()
+    if args.bench == "storage":
+        _report(f"FailureStorage.save, {args.records} records",
+                bench_storage(args.records, args.batch_size), "records/s")
+    elif args.bench == "statistics":
+        _report(f"fetch_statistics, {args.records} records",
+                bench_statistics(args.records), "queries/s")
+    elif args.bench == "normalize":
+        _report(f"normalization, {args.failures} failure lines",
+                bench_normalize(args.failures), "lines/s")
+    elif args.bench == "archive":
+        with tempfile.TemporaryDirectory() as tmp:
+            root = args.archive or Path(tmp) / "archive"
+            if root.exists():
+                print(f"Reusing archive {root}")
+            else:
+                start = time.perf_counter()
+                size = synthetic_archive(root, args.runs, args.failures, args.days)
+                print(f"Generated {args.runs} runs, {size / 2**20:.1f} MiB in {root} "
+                      f"({time.perf_counter() - start:.1f}s)")
+            results = bench_archive(root, args.days, args.tracker_latency, args.memory)
+        print("bot run stages")
+        _report_stages(results)
+        if args.json:
+            args.json.write_text(json.dumps({"args": {
+                "runs": args.runs, "failures": args.failures, "days": args.days,
+                "tracker_latency": args.tracker_latency, "memory": args.memory,
+            }, "stages": results}, indent=2))
+    elif args.bench == "conversion":
+        _report(f"reason conversion, {args.rules} prefix + {args.rules} substring rules",
+                bench_conversion(args.rules, args.failures), "reasons/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,12 @@ class Cleaner:
 
     def run(self) -> None:
         db = Path(self.cfg.db_name)
-        if db.exists() and not self.cfg.keep_db:
-            logger.debug("Removing database file: %s", db)
-            db.unlink()
+        if not self.cfg.keep_db:
+            # WAL mode leaves -wal/-shm side files next to the DB
+            for path in (db, db.with_name(db.name + "-wal"), db.with_name(db.name + "-shm")):
+                if path.exists():
+                    logger.debug("Removing database file: %s", path)
+                    path.unlink()
         # Remove any generated images in output_dir
         out = Path(self.cfg.output_dir)
         for img in out.glob("*_failure_statistics.png"):
@@ -44,14 +44,62 @@ def main():
         "--error_message", default=None,
         help="Only include failures matching this error message"
     )
+    parser.add_argument(
+        "--trend_windows", type=int, default=0,
+        help="Add a trends section comparing this many weekly windows and flagging regressions and new failures (default: 0, off; needs --keep_db history)"
+    )
+    parser.add_argument(
+        "--cluster_reasons", action="store_true",
+        help="Group near-duplicate failure reasons (differing ids, numbers, paths) into templates"
+    )
     parser.add_argument(
         "--keep_db", action="store_true",
         help="Retain database file after run"
     )
+    parser.add_argument(
+        "--batch_size", type=int, default=5000,
+        help="Number of failure records inserted per database batch (default: 5000)"
+    )
+    parser.add_argument(
+        "--store_url", default=None,
+        help="Also upload failures to this PostgREST table URL (default: $FAILURE_STORE_URL; credentials from $FAILURE_STORE_USER/$FAILURE_STORE_PASS or $FAILURE_STORE_TOKEN)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Keep the database between runs and only parse new or changed scrape.log files (bot mode, implies --keep_db)"
+    )
     parser.add_argument(
         "--bot", action="store_true",
         help="Enable bot mode: scan all versions/flavors under log_directory"
     )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of processes parsing scrape.log files in bot mode (0 = one per CPU, default: 1)"
+    )
+    parser.add_argument(
+        "--queue_size", type=int, default=64,
+        help="Parsed scrape.log files buffered ahead of the database writer in bot mode (default: 64)"
+    )
+    parser.add_argument(
+        "--tracker_workers", type=int, default=8,
+        help="Number of concurrent Redmine lookups while building the report (default: 8)"
+    )
+    parser.add_argument(
+        "--tracker_offline", action="store_true",
+        help="Match failures against the local tracker issue index instead of Redmine search"
+    )
+    parser.add_argument(
+        "--sync_tracker_index", action="store_true",
+        help="Refresh the local tracker issue index from Redmine before building the report"
+    )
+    parser.add_argument(
+        "--metrics_file", default=None,
+        help="Write per-phase timings and run counters as JSON to this file"
+    )
+    parser.add_argument(
+        "--prometheus_file", default=None,
+        help="Write the run metrics in Prometheus textfile format to this file (e.g. for node_exporter)"
+    )
     parser.add_argument(
         "--verbose", action="store_true",
         help="Enable verbose debug logging"
@@ -21,6 +21,18 @@ class Config:
         keep_db: bool = False,
         bot: bool = False,
         verbose: bool = False,
+        workers: int = 1,
+        incremental: bool = False,
+        batch_size: int = 5000,
+        tracker_workers: int = 8,
+        tracker_offline: bool = False,
+        sync_tracker_index: bool = False,
+        cluster_reasons: bool = False,
+        queue_size: int = 64,
+        metrics_file: Optional[str] = None,
+        prometheus_file: Optional[str] = None,
+        trend_windows: int = 0,
+        store_url: Optional[str] = None,
     ) -> None:
         self.db_name = db_name
         self.email = email
@@ -31,9 +43,34 @@ class Config:
         self.branch_name = branch_name
         self.flavor = flavor
         self.error_message = error_message
-        self.keep_db = keep_db
+        # incremental runs need the DB (and its processed_runs index) to survive
+        self.keep_db = keep_db or incremental
         self.bot = bot
         self.verbose = verbose
+        # 0 means one parser process per CPU
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.incremental = incremental
+        self.batch_size = batch_size
+        self.tracker_workers = tracker_workers
+        self.tracker_offline = tracker_offline
+        self.sync_tracker_index = sync_tracker_index
+        self.cluster_reasons = cluster_reasons
+        # parsed scrape.log files buffered between scanner and storage in bot mode
+        self.queue_size = queue_size
+        # per-phase timings and counters of the run, as JSON and/or a
+        # Prometheus textfile
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        # weekly windows compared in the report's trends section; 0 = off
+        self.trend_windows = trend_windows
+        # PostgREST table that also receives every stored failure, so several
+        # watcher hosts can share one database; None = local SQLite only
+        self.store_url = store_url or os.environ.get('FAILURE_STORE_URL') or None
+        self.store_user = os.environ.get('FAILURE_STORE_USER', '')
+        self.store_password = os.environ.get('FAILURE_STORE_PASS', '')
+        self.store_token = os.environ.get('FAILURE_STORE_TOKEN', '')
+        self.store_batch_size = int(os.environ.get('FAILURE_STORE_BATCH_SIZE', 1000))
+        self.store_retries = int(os.environ.get('FAILURE_STORE_RETRIES', 5))
 
         # supported versions and flavors
         self.versions = ['quincy', 'squid', 'main', 'reef', 'tentacle']
@@ -48,6 +85,17 @@ class Config:
         if not cache_path.is_absolute():
             cache_path = Path(__file__).resolve().parent / cache_path
         self.tracker_cache_file = cache_path
+        index_env = os.environ.get("TRACKER_INDEX")
+        index_path = Path(index_env).expanduser() if index_env else Path('tracker_index.json')
+        if not index_path.is_absolute():
+            index_path = Path(__file__).resolve().parent / index_path
+        self.tracker_index_file = index_path
+        # seconds before a single Redmine request is abandoned
+        self.tracker_timeout = float(os.environ.get('TRACKER_TIMEOUT', 30))
+        # cache lifetimes: found issues in days, "no issue found" in hours
+        self.tracker_cache_ttl = float(os.environ.get('TRACKER_CACHE_TTL_DAYS', 30)) * 86400
+        self.tracker_cache_negative_ttl = float(os.environ.get('TRACKER_CACHE_NEGATIVE_TTL_HOURS', 24)) * 3600
+        self.tracker_cache_max_entries = int(os.environ.get('TRACKER_CACHE_MAX_ENTRIES', 5000))
         
 
         # Output directory for graphs/images
@@ -78,4 +126,16 @@ class Config:
             keep_db=args.keep_db,
             bot=args.bot,
             verbose=args.verbose,
+            workers=getattr(args, 'workers', 1),
+            incremental=getattr(args, 'incremental', False),
+            batch_size=getattr(args, 'batch_size', 5000),
+            tracker_workers=getattr(args, 'tracker_workers', 8),
+            tracker_offline=getattr(args, 'tracker_offline', False),
+            sync_tracker_index=getattr(args, 'sync_tracker_index', False),
+            cluster_reasons=getattr(args, 'cluster_reasons', False),
+            queue_size=getattr(args, 'queue_size', 64),
+            metrics_file=getattr(args, 'metrics_file', None),
+            prometheus_file=getattr(args, 'prometheus_file', None),
+            trend_windows=getattr(args, 'trend_windows', 0),
+            store_url=getattr(args, 'store_url', None),
         )
@@ -4,45 +4,33 @@ import json
 import sqlite3
 import datetime
 
+from array import array
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from typing import List
-from .reason_conversion import reason_conversion
+from .normalize import canonical_reason, convert_reason, normalize_machine_name
 
-from .scan_scrapy_directories import scan_scrapy_directories
+from .scan_scrapy_directories import discover_scrapy_directories
 from .config import Config
-from typing import Tuple, Dict, List
+from typing import Callable, Deque, Tuple, Dict, Iterable, Iterator, List, Optional
 
 logger = logging.getLogger(__name__)
 
-# Conversion utilities
-
-def convert_reason(long_reason: str) -> str:
-    """
-    Map a raw failure message to a concise reason using predefined mappings.
-    """
-    return reason_conversion.get(long_reason, long_reason)
-
-
-def normalize_machine_name(log_string: str) -> str:
-    """
-    Normalize machine-specific details in a log string for consistent grouping.
-    """
-    s = re.sub(r'smithi\d+', 'smithi000', log_string)
-    s = re.sub(r'CEPH_REF=[a-f0-9]+', 'CEPH_REF=XXXXXXXXXXXXXXXXXX', s)
-    return s
-
-
 
 class FailureRecord:
-    __slots__ = ('directory', 'date', 'reason', 'job_id', 'version', 'flavor')
+    __slots__ = ('directory', 'date', 'reason', 'job_id', 'version', 'flavor', 'template_id')
 
-    def __init__(self, directory: str, date: str, reason: str, job_id: str, version: str = '', flavor: str = '') -> None:
+    def __init__(self, directory: str, date: str, reason: str, job_id: str, version: str = '', flavor: str = '',
+                 template_id: Optional[int] = None) -> None:
         self.directory = directory
         self.date = date
         self.reason = reason
         self.job_id = job_id
         self.version = version
         self.flavor = flavor
+        # set by ReasonClusterer when reason clustering is enabled
+        self.template_id = template_id
 
     @classmethod
     def from_dict(cls, d):
@@ -58,7 +46,151 @@ class FailureRecord:
     
     # printable representation
     def __repr__(self) -> str:
-        return f"FailureRecord(directory={self.directory}, date={self.date}, reason={self.reason}, job_id={self.job_id}, version={self.version}, flavor={self.flavor})"
+        return f"FailureRecord(directory={self.directory}, date={self.date}, reason={self.reason}, job_id={self.job_id}, version={self.version}, flavor={self.flavor}, template_id={self.template_id})"
+
+
+class RecordBatch:
+    """
+    Column-oriented FailureRecords. Strings are dictionary-encoded into one
+    shared pool (a scan repeats the same directory, date, version and reason
+    for thousands of rows) and job/template ids live in arrays, so a row
+    costs a few dozen bytes instead of a FailureRecord plus its strings, and
+    a batch pickles compactly between processes.
+
+    Iterating yields FailureRecords; rows() yields the tuples
+    FailureStorage.save inserts.
+    """
+    STRING_COLUMNS = ('directory', 'date', 'reason', 'version', 'flavor')
+    UNKNOWN_JOB = -1
+    NO_TEMPLATE = -1
+
+    def __init__(self) -> None:
+        self._strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._columns: Dict[str, array] = {name: array('I') for name in self.STRING_COLUMNS}
+        # numeric job ids as is; "unknown" as UNKNOWN_JOB; anything else as
+        # -(pool index + 2) so it round-trips unchanged
+        self._job_ids = array('q')
+        self._template_ids = array('i')
+
+    @classmethod
+    def from_records(cls, records: Iterable[FailureRecord]) -> "RecordBatch":
+        if isinstance(records, RecordBatch):
+            return records
+        batch = cls()
+        for rec in records:
+            batch.append(rec.directory, rec.date, rec.reason, rec.job_id,
+                         rec.version, rec.flavor, rec.template_id)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self._job_ids)
+
+    def __iter__(self) -> Iterator[FailureRecord]:
+        for directory, version, flavor, date, reason, job_id, template_id in self.rows():
+            yield FailureRecord(directory, date, reason, job_id, version, flavor, template_id)
+
+    def _intern(self, value: str) -> int:
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = self._ids[value] = len(self._strings)
+            self._strings.append(value)
+        return idx
+
+    def _encode_job(self, job_id: str) -> int:
+        if job_id == "unknown":
+            return self.UNKNOWN_JOB
+        # leading zeros and huge numbers would not survive int()
+        if job_id.isdigit() and len(job_id) < 19 and (job_id[0] != '0' or job_id == '0'):
+            return int(job_id)
+        return -(self._intern(job_id) + 2)
+
+    def _decode_job(self, value: int) -> str:
+        if value >= 0:
+            return str(value)
+        if value == self.UNKNOWN_JOB:
+            return "unknown"
+        return self._strings[-value - 2]
+
+    def append(self, directory: str, date: str, reason: str, job_id: str,
+               version: str = '', flavor: str = '', template_id: Optional[int] = None) -> None:
+        columns = self._columns
+        columns['directory'].append(self._intern(directory))
+        columns['date'].append(self._intern(date))
+        columns['reason'].append(self._intern(reason))
+        columns['version'].append(self._intern(version))
+        columns['flavor'].append(self._intern(flavor))
+        self._job_ids.append(self._encode_job(job_id))
+        self._template_ids.append(self.NO_TEMPLATE if template_id is None else template_id)
+
+    def extend(self, other: "RecordBatch") -> None:
+        """Append every row of `other`, re-encoding its strings into this pool."""
+        remap = [self._intern(value) for value in other._strings]
+        for name, column in self._columns.items():
+            column.extend(remap[i] for i in other._columns[name])
+        self._job_ids.extend(
+            job if job >= self.UNKNOWN_JOB else -(remap[-job - 2] + 2)
+            for job in other._job_ids
+        )
+        self._template_ids.extend(other._template_ids)
+
+    def fill(self, column: str, value: str) -> None:
+        """Set string `column` (e.g. version or flavor) of every row to `value`."""
+        self._columns[column] = array('I', [self._intern(value)]) * len(self)
+
+    def assign_templates(self, cluster: Callable[[str], int]) -> None:
+        """Set each row's template id to cluster(reason), once per distinct reason."""
+        ids: Dict[int, int] = {}
+        self._template_ids = array('i', (
+            ids[r] if r in ids else ids.setdefault(r, cluster(self._strings[r]))
+            for r in self._columns['reason']
+        ))
+
+    def value_counts(
+        self,
+        key: Callable[[str, int], object] = lambda reason, _: reason,
+        since: Optional[str] = None,
+    ) -> Counter:
+        """
+        Count rows by key(reason, template_id) (template_id is NO_TEMPLATE if
+        unset). With `since` ('YYYY-MM-DD'), only rows dated on or after it count.
+        """
+        if since is None:
+            pairs = Counter(zip(self._columns['reason'], self._template_ids))
+        else:
+            recent = {d for d in set(self._columns['date']) if self._strings[d] >= since}
+            pairs = Counter(
+                (reason, template_id)
+                for reason, template_id, day in zip(
+                    self._columns['reason'], self._template_ids, self._columns['date'])
+                if day in recent
+            )
+        counts: Counter = Counter()
+        for (reason, template_id), n in pairs.items():
+            counts[key(self._strings[reason], template_id)] += n
+        return counts
+
+    def job_ids_by(self, key: Callable[[str, int], object] = lambda reason, _: reason) -> Dict[object, List[str]]:
+        """Job ids in row order, grouped by key(reason, template_id)."""
+        grouped: Dict[object, List[str]] = {}
+        cache: Dict[Tuple[int, int], object] = {}
+        for reason, template_id, job in zip(self._columns['reason'], self._template_ids, self._job_ids):
+            k = cache.get((reason, template_id))
+            if k is None:
+                k = cache[(reason, template_id)] = key(self._strings[reason], template_id)
+            grouped.setdefault(k, []).append(self._decode_job(job))
+        return grouped
+
+    def rows(self) -> Iterator[Tuple[str, str, str, str, str, str, Optional[int]]]:
+        """(directory, version, flavor, date, reason, job_id, template_id) per row."""
+        strings = self._strings
+        c = self._columns
+        for directory, version, flavor, date, reason, job, template_id in zip(
+                c['directory'], c['version'], c['flavor'], c['date'], c['reason'],
+                self._job_ids, self._template_ids):
+            yield (strings[directory], strings[version], strings[flavor], strings[date],
+                   strings[reason], self._decode_job(job),
+                   None if template_id == self.NO_TEMPLATE else template_id)
 
 class LogParser:
     """
@@ -75,39 +207,57 @@ class LogParser:
         self.verbose = verbose
 
     def parse_file(self, file_path: Path) -> List[FailureRecord]:
-        failures: List[FailureRecord] = []
-        current_reason: Optional[str] = None
-        lines = file_path.read_text().splitlines()
+        return list(self.iter_file(file_path))
+
+    def iter_file(self, file_path: Path) -> Iterator[FailureRecord]:
+        """
+        Lazily parse `file_path` line by line, yielding each FailureRecord as
+        soon as its job IDs are seen, so memory does not grow with log size.
+        """
+        directory = str(file_path.parent)
+        date = self._extract_date(file_path)
+        logger.debug(f"\n\n\nParsing file: {file_path}\n")
+        with open(file_path) as fh:
+            for reason, job_id in self._iter_lines(fh):
+                yield FailureRecord(directory=directory, date=date, reason=reason, job_id=job_id)
+
+    def parse_batch(self, file_path: Path) -> RecordBatch:
+        """Parse `file_path` straight into a RecordBatch, without FailureRecord objects."""
+        directory = str(file_path.parent)
+        date = self._extract_date(file_path)
         logger.debug(f"\n\n\nParsing file: {file_path}\n")
-        for line in lines:
+        batch = RecordBatch()
+        with open(file_path) as fh:
+            for reason, job_id in self._iter_lines(fh):
+                batch.append(directory, date, reason, job_id)
+        return batch
+
+    def _iter_lines(self, fh: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """Yield (reason, job_id) for every failed job in a scrape.log."""
+        current_reason: Optional[str] = None
+        for line in fh:
+            line = line.rstrip("\r\n")
             #logger.debug(f"Processing line: {line.strip()}\n")
             # High-importance backtrace marker
             if "MAX_BACKTRACE_LINES" in line:
                 current_reason = "BACKTRACE"
-                failures.append(FailureRecord(
-                    directory=str(file_path.parent),
-                    date=self._extract_date(file_path),
-                    reason=current_reason,
-                    job_id="unknown"
-                ))
+                yield current_reason, "unknown"
                 continue
 
             m = self.FAILURE_RE.search(line)
             if m:
                 # add back timeout keyword since it was stripped
                 if line.startswith("Timeout"):
-                    normalized = normalize_machine_name("Timeout " + m.group(1))
+                    current_reason = canonical_reason("Timeout " + m.group(1))
                 else:
-                    normalized = normalize_machine_name(m.group(1))
-                current_reason = convert_reason(normalized)
+                    current_reason = canonical_reason(m.group(1))
                 if self.verbose:
                     logger.debug(f"Detected failure reason: {current_reason}")
                 continue
 
             m = self.DEAD_RE.search(line)
             if m:
-                normalized = normalize_machine_name(m.group(1))
-                current_reason = convert_reason(normalized)
+                current_reason = canonical_reason(m.group(1))
                 if self.verbose:
                     logger.debug(f"Detected dead reason: {current_reason}")
                 continue
@@ -115,13 +265,7 @@ class LogParser:
             # Extract job IDs
             if current_reason:
                 for job in self.JOB_RE.findall(line):
-                    failures.append(FailureRecord(
-                        directory=str(file_path.parent),
-                        date=self._extract_date(file_path),
-                        reason=current_reason,
-                        job_id=job,
-
-                    ))
+                    yield current_reason, job
                 current_reason = None  # Reset after processing job IDs
 
             # Handle "NN jobs" summary lines
@@ -136,13 +280,18 @@ class LogParser:
             #            reason=current_reason,
             #            job_id="unknown"
             #        ))
-        return failures
 
     def _extract_date(self, file_path: Path) -> str:
         m = self.DATE_RE.search(str(file_path))
         return m.group(1) if m else datetime.date.today().isoformat()
 
 
+def _parse_scrape_logs(log_paths: List[str], verbose: bool) -> List[RecordBatch]:
+    """Process-pool entry point: parse a chunk of scrape.log files in a worker process."""
+    parser = LogParser(verbose=verbose)
+    return [parser.parse_batch(Path(p)) for p in log_paths]
+
+
 class FailureScanner:
     """
     Scans logs under a base directory, either a single scrape.log dir or all version/flavor dirs.
@@ -150,75 +299,146 @@ class FailureScanner:
     def __init__(self, cfg: Config) -> None:
         self.cfg = cfg
         self.base = Path(cfg.log_directory)
+        # (directory, size, mtime) of the scrape.log files parsed by the
+        # last incremental scan_tree, to be marked processed once stored
+        self.new_runs: List[Tuple[str, int, float]] = []
+        # total size of the scrape.log files the last discover() left to parse
+        self.pending_bytes = 0
 
-    def scan_directory(self, path: Path) -> Tuple[List[FailureRecord], List[str]]:
+    def scan_directory(self, path: Path) -> Tuple[RecordBatch, List[str]]:
         """Scan a single directory containing scrape.log and return parsed records."""
         logger.debug("Scanning single directory: %s", path)
         log_file = path / 'scrape.log'
         if not log_file.exists():
             logger.error("No scrape.log in %s", path)
-            return [], [str(path)]
+            return RecordBatch(), [str(path)]
         parser = LogParser(verbose=self.cfg.verbose)
-        return parser.parse_file(log_file), [str(path)]
+        return parser.parse_batch(log_file), [str(path)]
 
-    def scan_tree(self) -> Tuple[Dict[str, Dict[str, List[FailureRecord]]], Dict[str, Dict[str, List[str]]]]:
+    def discover(
+        self,
+        processed: Optional[Dict[str, Tuple[int, float]]] = None,
+    ) -> Tuple[List[Tuple[str, str, Path]], Dict[str, Dict[str, List[str]]]]:
         """
-        Scan all version/flavor directories under base, group failures by
-        version & flavor, and return a JSON blob.
+        Find the scrape.log files under base for every version/flavor.
+
+        Returns the (version, flavor, scrape.log path) entries to parse and
+        the directories grouped by version and flavor. If `processed`
+        ({ directory: (size, mtime) }) is given, scrape.log files whose size
+        and mtime are unchanged are skipped, and the ones left to parse are
+        listed in self.new_runs.
         """
-        logger.debug("Scanning full tree under: %s", self.base)
-        parser = LogParser(verbose=self.cfg.verbose)
+        pending: List[Tuple[str, str, Path]] = []
+        self.new_runs = []
+        self.pending_bytes = 0
 
-        # Structure: { version: { flavor: [ record_dict, ... ] } }
-        result: Dict[str, Dict[str, List[Dict]]] = {}
-        records: Dict[str, Dict[str, List[FailureRecord]]] = {
-            version: {flavor: [] for flavor in self.cfg.flavors}
-            for version in self.cfg.versions
-        }
-        grouped_dirs: Dict[str, Dict[str, List[str]]] = {
-            version: {flavor: [] for flavor in self.cfg.flavors}
-            for version in self.cfg.versions
+        # list the archive root once for every version/flavor combination
+        flavor_specs = {
+            flavor: (
+                "*" if flavor == 'crimson' else self.cfg.bot_users,
+                f"crimson-{self.cfg.suite_name}" if flavor == 'crimson' else self.cfg.suite_name,
+            )
+            for flavor in self.cfg.flavors
         }
-        logger.debug("Grouped directories initialized: %s", grouped_dirs)
+        logger.debug("Tree scan for versions=%s flavors=%s", self.cfg.versions, flavor_specs)
+        grouped_dirs = discover_scrapy_directories(
+            log_directory=str(self.base),
+            days=self.cfg.days,
+            versions=self.cfg.versions,
+            flavors=flavor_specs,
+            verbose=self.cfg.verbose,
+        )
 
         for version in self.cfg.versions:
-            
             for flavor in self.cfg.flavors:
-                suite_name = (
-                    f"crimson-{self.cfg.suite_name}"
-                    if flavor == 'crimson'
-                    else self.cfg.suite_name
-                )
-                bot_users = (
-                    "*" if flavor == 'crimson' 
-                    else self.cfg.bot_users
-                )
-                logger.debug("Tree scan for version=%s flavor=%s suite_name=%s users=%s", version, flavor, suite_name, bot_users)
-                dirs = scan_scrapy_directories(
-                    log_directory=str(self.base),
-                    days=self.cfg.days,
-                    # drop db_name here if it's not needed for scanning
-                    user_name=bot_users,
-                    suite_name=suite_name,
-                    version=version,
-                    branch_name=self.cfg.branch_name,
-                    flavor=flavor,
-                    verbose=self.cfg.verbose,
-                )
-                grouped_dirs[version][flavor] = dirs
+                dirs = grouped_dirs[version][flavor]
                 logger.debug("Found %s directories for version=%s flavor=%s", dirs, version, flavor)
 
                 for d in dirs:
                     log_path = Path(d) / 'scrape.log'
-                    if log_path.exists():
-                        recs = parser.parse_file(log_path)
-                        records[version][flavor].extend(recs)
-                        for r in recs:
-                            r.version = version
-                            r.flavor = flavor
-                        logger.debug("Parsed %d records from %s", len(recs), log_path)
-                    else:
+                    try:
+                        st = log_path.stat()
+                    except FileNotFoundError:
                         logger.warning("No scrape.log found in %s", log_path)
+                        continue
+                    if processed is not None:
+                        directory = str(log_path.parent)
+                        if processed.get(directory) == (st.st_size, st.st_mtime):
+                            logger.debug("Skipping already processed %s", log_path)
+                            continue
+                        self.new_runs.append((directory, st.st_size, st.st_mtime))
+                    pending.append((version, flavor, log_path))
+                    self.pending_bytes += st.st_size
+        return pending, grouped_dirs
+
+    def iter_parsed(
+        self,
+        pending: List[Tuple[str, str, Path]],
+    ) -> Iterator[Tuple[str, str, Path, RecordBatch]]:
+        """
+        Parse the entries returned by discover(), yielding
+        (version, flavor, path, records) per scrape.log in the same order as
+        soon as each one is parsed.
+        """
+        for (version, flavor, log_path), recs in zip(
+                pending, self._iter_logs([log_path for _, _, log_path in pending])):
+            recs.fill('version', version)
+            recs.fill('flavor', flavor)
+            logger.debug("Parsed %d records from %s", len(recs), log_path)
+            yield version, flavor, log_path, recs
+
+    def scan_tree(
+        self,
+        processed: Optional[Dict[str, Tuple[int, float]]] = None,
+    ) -> Tuple[Dict[str, Dict[str, RecordBatch]], Dict[str, Dict[str, List[str]]]]:
+        """
+        Scan all version/flavor directories under base, group failures by
+        version & flavor, and return a JSON blob.
+
+        `processed` is passed on to discover().
+        """
+        logger.debug("Scanning full tree under: %s", self.base)
+
+        # Structure: { version: { flavor: RecordBatch } }
+        records: Dict[str, Dict[str, RecordBatch]] = {
+            version: {flavor: RecordBatch() for flavor in self.cfg.flavors}
+            for version in self.cfg.versions
+        }
+        pending, grouped_dirs = self.discover(processed)
+        # results come back in submission order, so the merge is deterministic
+        for version, flavor, _, recs in self.iter_parsed(pending):
+            records[version][flavor].extend(recs)
 
         logger.debug("Total versions scanned: %d", len(records))
-        return records, grouped_dirs
\ No newline at end of file
+        return records, grouped_dirs
+
+    def _iter_logs(self, log_paths: List[Path]) -> Iterator[RecordBatch]:
+        """
+        Parse every scrape.log in `log_paths`, yielding one RecordBatch per
+        path in the same order. Uses a process pool when cfg.workers > 1,
+        keeping only a few chunks per worker in flight so parsed results
+        never pile up ahead of a slow consumer.
+        """
+        workers = self.cfg.workers
+        if workers <= 1 or len(log_paths) < 2:
+            parser = LogParser(verbose=self.cfg.verbose)
+            for p in log_paths:
+                yield parser.parse_batch(p)
+            return
+
+        workers = min(workers, len(log_paths))
+        chunksize = max(1, len(log_paths) // (workers * 4))
+        chunks = [
+            [str(p) for p in log_paths[i:i + chunksize]]
+            for i in range(0, len(log_paths), chunksize)
+        ]
+        logger.debug("Parsing %d scrape.log files with %d workers (chunksize=%d)",
+                     len(log_paths), workers, chunksize)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight: Deque[Future] = deque()
+            for chunk in chunks:
+                in_flight.append(pool.submit(_parse_scrape_logs, chunk, self.cfg.verbose))
+                if len(in_flight) >= workers * 2:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
@@ -1,25 +1,86 @@
 import sqlite3
-from typing import Optional, Any
+from abc import ABC, abstractmethod
+from collections import Counter
+from itertools import islice
+from typing import Optional, Any, NamedTuple, Tuple
 from pathlib import Path
-from typing import List, Dict
-from .failure_scanner import FailureRecord
+from typing import Iterable, List, Dict
+from .failure_scanner import FailureRecord, RecordBatch
 import logging
 
 log = logging.getLogger(__name__)
 
-class FailureStorage:
+
+class ReasonTrend(NamedTuple):
+    """Occurrences of one reason over the windows of FailureStorage.fetch_trends."""
+    daily: Dict[str, int]       # 'YYYY-MM-DD' -> count
+    windows: List[int]          # count per window, oldest first
+    first_seen: str             # first day within the horizon
+
+    @property
+    def delta(self) -> int:
+        """Change of the latest window over the one before it."""
+        return self.windows[-1] - (self.windows[-2] if len(self.windows) > 1 else 0)
+
+    @property
+    def is_new(self) -> bool:
+        """Seen in the latest window but in none of the earlier ones."""
+        return len(self.windows) > 1 and self.windows[-1] > 0 and not any(self.windows[:-1])
+
+
+class FailureWriter(ABC):
+    """
+    Somewhere failure records can be written. FailureStorage is the local
+    SQLite store the report is built from; further writers (see
+    postgrest_writer.py) receive the same records, e.g. for a store shared
+    by several watcher hosts.
+    """
+
+    @abstractmethod
+    def setup(self) -> None:
+        """Prepare the writer; called once before anything is saved."""
+
+    @abstractmethod
+    def save(self, records: Iterable[FailureRecord]) -> int:
+        """Write FailureRecords (or a RecordBatch); returns the number accepted."""
+
+    @abstractmethod
+    def purge_directories(self, directories: List[str]) -> None:
+        """Drop failures of runs that are about to be written again."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Finish outstanding writes and release resources."""
+
+    def lost_writes(self) -> bool:
+        """True if some records or purges never reached the store."""
+        return False
+
+
+class FailureStorage(FailureWriter):
     """
     Persists failures and fetches aggregated stats.
     """
-    def __init__(self, db_path: Path) -> None:
+    def __init__(self, db_path: Path, batch_size: int = 5000, ephemeral: bool = False) -> None:
         # Initialize with path to SQLite DB
         self.db_path = Path(db_path)
         self.conn: Optional[sqlite3.Connection] = None
+        # rows per executemany() call in save()
+        self.batch_size = max(1, batch_size)
+        # an ephemeral DB is deleted after the run, so durability is not needed
+        self.ephemeral = ephemeral
+        # an ephemeral DB is loaded once and then queried, so save() leaves
+        # failure_daily alone and it is rebuilt before the first fetch
+        self._rollup_stale = False
 
     def setup(self) -> None:
-        """Create the failures table if it doesn't exist."""
+        """Create the failures and processed_runs tables if they don't exist."""
         self.conn = sqlite3.connect(self.db_path)
         cur = self.conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA synchronous={'OFF' if self.ephemeral else 'NORMAL'}")
+        if self.ephemeral:
+            cur.execute("PRAGMA temp_store=MEMORY")
         cur.execute(
             '''
             CREATE TABLE IF NOT EXISTS failures (
@@ -29,32 +90,214 @@ class FailureStorage:
                 flavor    TEXT,
                 date TEXT,
                 reason TEXT,
-                job_id TEXT
+                job_id TEXT,
+                template_id INTEGER
+            )
+            '''
+        )
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(failures)")}
+        if "template_id" not in columns:
+            # DB kept from before reason clustering
+            cur.execute("ALTER TABLE failures ADD COLUMN template_id INTEGER")
+        cur.execute("CREATE INDEX IF NOT EXISTS failures_vfd ON failures (version, flavor, date)")
+        cur.execute("CREATE INDEX IF NOT EXISTS failures_directory ON failures (directory)")
+        # per-day failure counts, kept up to date by save() (or rebuilt after
+        # the load for an ephemeral DB) so fetch_statistics never has to scan
+        # the raw failures table
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS failure_daily (
+                version TEXT,
+                flavor  TEXT,
+                date    TEXT,
+                reason  TEXT,
+                count   INTEGER NOT NULL,
+                PRIMARY KEY (version, flavor, date, reason)
+            ) WITHOUT ROWID
+            '''
+        )
+        # DBs kept from before the rollup existed get it filled once
+        if (cur.execute("SELECT 1 FROM failure_daily LIMIT 1").fetchone() is None
+                and cur.execute("SELECT 1 FROM failures LIMIT 1").fetchone() is not None):
+            log.debug("Building failure_daily rollup from existing failures")
+            self._build_rollup(cur)
+        # learned reason templates and which template each raw reason maps to
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS reason_templates (
+                id       INTEGER PRIMARY KEY,
+                template TEXT
+            )
+            '''
+        )
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS reason_template_map (
+                reason      TEXT PRIMARY KEY,
+                template_id INTEGER
+            )
+            '''
+        )
+        # scrape.log files already ingested, for incremental runs
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS processed_runs (
+                directory TEXT PRIMARY KEY,
+                size      INTEGER,
+                mtime     REAL
             )
             '''
         )
         self.conn.commit()
 
-    def save(self, records: List[FailureRecord]) -> None:
-        """Bulk-insert a list of FailureRecord into the DB."""
+    def close(self) -> None:
+        """Close the DB connection, checkpointing the WAL into the main file."""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def processed_runs(self) -> Dict[str, Tuple[int, float]]:
+        """Return { directory: (size, mtime) } of every ingested scrape.log."""
         if not self.conn:
             raise RuntimeError("Database not initialized. Call setup() first.")
         cur = self.conn.cursor()
-        for rec in records:
-            cur.execute(
-                '''
-                INSERT INTO failures
-                  (directory, version, flavor, date, reason, job_id)
-                VALUES (?,       ?,       ?,      ?,    ?,      ?)
-                ''',
-                (rec.directory,
-                 rec.version,
-                 rec.flavor,
-                 rec.date,
-                 rec.reason,
-                 rec.job_id)
-            )
+        cur.execute("SELECT directory, size, mtime FROM processed_runs")
+        return {directory: (size, mtime) for directory, size, mtime in cur.fetchall()}
+
+    def purge_directories(self, directories: List[str]) -> None:
+        """Delete stored failures of runs that are about to be re-ingested."""
+        if not self.conn:
+            raise RuntimeError("Database not initialized. Call setup() first.")
+        with self.conn:
+            cur = self.conn.cursor()
+            for directory in directories:
+                if not self.ephemeral:
+                    cur.execute(
+                        '''
+                        SELECT version, flavor, date, reason, COUNT(*) FROM failures
+                        WHERE directory = ? GROUP BY version, flavor, date, reason
+                        ''',
+                        (directory,),
+                    )
+                    removed = Counter({tuple(row[:4]): row[4] for row in cur.fetchall()})
+                    self._update_rollup(cur, removed, sign=-1)
+                cur.execute("DELETE FROM failures WHERE directory = ?", (directory,))
+            if self.ephemeral:
+                self._rollup_stale = True
+            else:
+                cur.execute("DELETE FROM failure_daily WHERE count <= 0")
+
+    def mark_processed(self, runs: List[Tuple[str, int, float]]) -> None:
+        """Record (directory, size, mtime) of scrape.log files just ingested."""
+        if not self.conn:
+            raise RuntimeError("Database not initialized. Call setup() first.")
+        cur = self.conn.cursor()
+        cur.executemany(
+            "INSERT OR REPLACE INTO processed_runs (directory, size, mtime) VALUES (?, ?, ?)",
+            runs,
+        )
         self.conn.commit()
+        log.debug("Marked %d runs as processed", len(runs))
+
+    def load_templates(self) -> Tuple[Dict[int, str], Dict[str, int]]:
+        """Return ({ template_id: template }, { reason: template_id })."""
+        if not self.conn:
+            raise RuntimeError("Database not initialized. Call setup() first.")
+        cur = self.conn.cursor()
+        templates = dict(cur.execute("SELECT id, template FROM reason_templates").fetchall())
+        reason_map = dict(cur.execute("SELECT reason, template_id FROM reason_template_map").fetchall())
+        return templates, reason_map
+
+    def save_templates(self, templates: Dict[int, str], reason_map: Dict[str, int]) -> None:
+        """Upsert new or generalized templates and new reason mappings."""
+        if not self.conn:
+            raise RuntimeError("Database not initialized. Call setup() first.")
+        with self.conn:
+            cur = self.conn.cursor()
+            cur.executemany(
+                "INSERT OR REPLACE INTO reason_templates (id, template) VALUES (?, ?)",
+                templates.items(),
+            )
+            cur.executemany(
+                "INSERT OR REPLACE INTO reason_template_map (reason, template_id) VALUES (?, ?)",
+                reason_map.items(),
+            )
+        log.debug("Saved %d templates and %d reason mappings", len(templates), len(reason_map))
+
+    def save(self, records: Iterable[FailureRecord]) -> int:
+        """
+        Bulk-insert FailureRecords (or a RecordBatch) into the DB in batches
+        of batch_size, all within a single transaction. Returns the number
+        of rows stored.
+        """
+        if not self.conn:
+            raise RuntimeError("Database not initialized. Call setup() first.")
+        if isinstance(records, RecordBatch):
+            rows = records.rows()
+        else:
+            rows = (
+                (rec.directory, rec.version, rec.flavor, rec.date, rec.reason, rec.job_id, rec.template_id)
+                for rec in records
+            )
+        total = 0
+        with self.conn:
+            cur = self.conn.cursor()
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                cur.executemany(
+                    '''
+                    INSERT INTO failures
+                      (directory, version, flavor, date, reason, job_id, template_id)
+                    VALUES (?,       ?,       ?,      ?,    ?,      ?,      ?)
+                    ''',
+                    batch,
+                )
+                if not self.ephemeral:
+                    self._update_rollup(cur, Counter(
+                        (version, flavor, date, reason)
+                        for _, version, flavor, date, reason, _, _ in batch
+                    ))
+                total += len(batch)
+        if total and self.ephemeral:
+            self._rollup_stale = True
+        log.debug("Saved %d records in batches of %d", total, self.batch_size)
+        return total
+
+    @staticmethod
+    def _update_rollup(cur: sqlite3.Cursor, counts: Counter, sign: int = 1) -> None:
+        """Add (or with sign=-1 subtract) per-day counts to failure_daily."""
+        cur.executemany(
+            '''
+            INSERT INTO failure_daily (version, flavor, date, reason, count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (version, flavor, date, reason)
+            DO UPDATE SET count = count + excluded.count
+            ''',
+            [(*key, sign * n) for key, n in counts.items()],
+        )
+
+    @staticmethod
+    def _build_rollup(cur: sqlite3.Cursor) -> None:
+        """Fill failure_daily from the failures table in one pass."""
+        cur.execute("DELETE FROM failure_daily")
+        # a plain table scan beats walking failures_vfd and looking each row up
+        cur.execute(
+            '''
+            INSERT INTO failure_daily (version, flavor, date, reason, count)
+            SELECT version, flavor, date, reason, COUNT(*) FROM failures NOT INDEXED
+            GROUP BY version, flavor, date, reason
+            '''
+        )
+
+    def _refresh_rollup(self) -> None:
+        # rebuild failure_daily once after an ephemeral load
+        if self._rollup_stale:
+            with self.conn:
+                self._build_rollup(self.conn.cursor())
+            self._rollup_stale = False
+            log.debug("Built failure_daily rollup after the load")
 
     def fetch_statistics(
         self,
@@ -63,36 +306,27 @@ class FailureStorage:
         since_days: Optional[int] = None,
         error_msg: Optional[str] = None,
         top_n: int = 10,
+        by_template: bool = False,
     ) -> Dict[str, int]:
         """
         Retrieve the top failure reasons, filtered by optional version, flavor,
-        date range (since_days), or containing error_msg.
+        date range (since_days), or containing error_msg. With by_template,
+        reasons are grouped under their learned template where one exists.
         """
         if not self.conn:
             raise RuntimeError("Database not initialized. Call setup() first.")
+        self._refresh_rollup()
         cur = self.conn.cursor()
-        clauses: List[str] = []
-        params: List[Any] = []
-
-        if version:
-            clauses.append("version = ?")
-            params.append(version)
-        if flavor:
-            clauses.append("flavor = ?")
-            params.append(flavor)
+        label, joins, clauses, params = self._rollup_source(version, flavor, error_msg, by_template)
         if since_days:
             # date stored as 'YYYY-MM-DD', use SQLite date functions
-            clauses.append("date >= date('now', ?)")
+            clauses.append("d.date >= date('now', ?)")
             params.append(f"-{since_days} days")
-        if error_msg:
-            clauses.append("reason LIKE ?")
-            params.append(f"%{error_msg}%")
 
-        where_clause = f"WHERE {' AND '.join(clauses)}" if clauses else ''
         query = (
-            f"SELECT reason, COUNT(*) FROM failures "
+            f"SELECT {label}, SUM(d.count) FROM failure_daily d {joins}"
             f"{'WHERE ' + ' AND '.join(clauses) if clauses else ''} "
-            "GROUP BY reason ORDER BY COUNT(*) DESC LIMIT ?"
+            f"GROUP BY {label} ORDER BY SUM(d.count) DESC LIMIT ?"
         )
         log.debug("----- Executing query: %s", query)
         params.append(top_n)
@@ -100,3 +334,90 @@ class FailureStorage:
         cur.execute(query, tuple(params))
         rows = cur.fetchall()
         return {reason: count for reason, count in rows}
+
+    def fetch_trends(
+        self,
+        version: Optional[str] = None,
+        flavor: Optional[str] = None,
+        windows: int = 4,
+        window_days: int = 7,
+        error_msg: Optional[str] = None,
+        by_template: bool = False,
+        limit: Optional[int] = None,
+    ) -> Dict[str, ReasonTrend]:
+        """
+        Per-reason trends over the last `windows` windows of `window_days`
+        days each (window 0 ends today), from one pass over failure_daily.
+
+        Returns { reason: ReasonTrend } ordered by count in the latest
+        window, at most `limit` reasons. Filters match fetch_statistics.
+        """
+        if not self.conn:
+            raise RuntimeError("Database not initialized. Call setup() first.")
+        self._refresh_rollup()
+        windows = max(1, windows)
+        window_days = max(1, window_days)
+        label, joins, clauses, params = self._rollup_source(version, flavor, error_msg, by_template)
+        clauses.append("d.date >= date('now', ?)")
+        params.append(f"-{windows * window_days - 1} days")
+
+        # per reason and day, tag each row with its window, the window
+        # total and the first day the reason shows up in the horizon
+        query = f"""
+            WITH daily AS (
+                SELECT {label} AS reason, d.date AS date, SUM(d.count) AS n,
+                       MAX(0, CAST((julianday(date('now')) - julianday(d.date)) / ? AS INTEGER)) AS widx
+                FROM failure_daily d {joins}
+                WHERE {' AND '.join(clauses)}
+                GROUP BY {label}, d.date
+            )
+            SELECT reason, date, n, widx,
+                   SUM(n) OVER (PARTITION BY reason, widx) AS window_total,
+                   MIN(date) OVER (PARTITION BY reason) AS first_seen
+            FROM daily
+            ORDER BY reason, date
+        """
+        cur = self.conn.cursor()
+        cur.execute(query, (window_days, *params))
+
+        trends: Dict[str, ReasonTrend] = {}
+        for reason, day, n, widx, window_total, first_seen in cur:
+            trend = trends.get(reason)
+            if trend is None:
+                trend = trends[reason] = ReasonTrend({}, [0] * windows, first_seen)
+            trend.daily[day] = n
+            # windows are listed oldest first
+            trend.windows[windows - 1 - widx] = window_total
+
+        ordered = sorted(trends.items(), key=lambda kv: (-kv[1].windows[-1], kv[0]))
+        return dict(ordered[:limit] if limit is not None else ordered)
+
+    @staticmethod
+    def _rollup_source(
+        version: Optional[str],
+        flavor: Optional[str],
+        error_msg: Optional[str],
+        by_template: bool,
+    ) -> Tuple[str, str, List[str], List[Any]]:
+        """Label, joins and WHERE clauses for a query over failure_daily d."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if version:
+            clauses.append("d.version = ?")
+            params.append(version)
+        if flavor:
+            clauses.append("d.flavor = ?")
+            params.append(flavor)
+        if error_msg:
+            clauses.append("d.reason LIKE ?")
+            params.append(f"%{error_msg}%")
+
+        if by_template:
+            label = "COALESCE(t.template, d.reason)"
+            joins = (
+                "LEFT JOIN reason_template_map m ON m.reason = d.reason "
+                "LEFT JOIN reason_templates t ON t.id = m.template_id "
+            )
+        else:
+            label, joins = "d.reason", ""
+        return label, joins, clauses, params
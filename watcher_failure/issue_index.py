@@ -0,0 +1,119 @@
+"""
+Offline TF-IDF index over Ceph tracker issues.
+
+``RedmineConnector.sync_index`` dumps the subject/description of every issue
+in the project to a JSON file; ``IssueIndex`` loads that dump and answers
+``search`` by cosine similarity over an inverted index, returning candidates
+shaped like Redmine search results so ``_find_best_match`` can rank them
+exactly as it does online results.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import os
+import re
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9_]{2,}")
+# only the head of long descriptions is indexed; it keeps build time and
+# memory bounded and is where the failure text usually is
+MAX_DESCRIPTION_CHARS = 2000
+TITLE_WEIGHT = 2
+# terms found in more than this share of issues add little to the ranking
+# but cost a walk over most of the postings, so queries skip them when
+# they have rarer terms to go on
+COMMON_TERM_RATIO = 0.1
+
+
+class IndexedIssue(NamedTuple):
+    id: int
+    title: str
+    description: str
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class IssueIndex:
+    """Inverted TF-IDF index; ``search`` costs one posting-list walk per query term."""
+
+    def __init__(self, issues: Iterable[Dict[str, Any]]) -> None:
+        self.issues: List[IndexedIssue] = []
+        doc_terms: List[Counter] = []
+        df: Counter = Counter()
+        for raw in issues:
+            subject = raw.get("subject") or ""
+            description = raw.get("description") or ""
+            # "#id: subject" mirrors /search.json titles for _trim_after_colon
+            self.issues.append(IndexedIssue(int(raw["id"]), f"#{raw['id']}: {subject}", description))
+            terms = Counter(_tokens(description[:MAX_DESCRIPTION_CHARS]))
+            for tok in _tokens(subject):
+                terms[tok] += TITLE_WEIGHT
+            doc_terms.append(terms)
+            df.update(terms.keys())
+
+        n_docs = len(self.issues)
+        self.idf: Dict[str, float] = {
+            term: math.log((1 + n_docs) / (1 + n)) + 1.0 for term, n in df.items()
+        }
+        self.postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for doc, terms in enumerate(doc_terms):
+            weights = {t: (1 + math.log(tf)) * self.idf[t] for t, tf in terms.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, w in weights.items():
+                self.postings[term].append((doc, w / norm))
+
+    def __len__(self) -> int:
+        return len(self.issues)
+
+    # persistence -------------------------------------------------------
+    @classmethod
+    def load(cls, path: str | Path) -> "IssueIndex":
+        with open(Path(path).expanduser(), "r", encoding="utf-8") as fh:
+            return cls(json.load(fh)["issues"])
+
+    @staticmethod
+    def dump(issues: Iterable[Dict[str, Any]], path: str | Path) -> int:
+        """
+        Write an issue dump for ``load``; returns the number of issues. The
+        file is replaced atomically, so a failed sync or a concurrent reader
+        never sees a partial dump.
+        """
+        rows = list(issues)
+        path = Path(path).expanduser()
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump({"synced_at": time.time(), "issues": rows}, fh, separators=(",", ":"))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return len(rows)
+
+    # search ------------------------------------------------------------
+    def search(self, query: str, limit: int = 50) -> List[IndexedIssue]:
+        """Return up to *limit* issues most similar to *query*, best first."""
+        q_terms = Counter(t for t in _tokens(query) if t in self.idf)
+        if not q_terms:
+            return []
+        max_df = COMMON_TERM_RATIO * len(self.issues)
+        rare = {t: tf for t, tf in q_terms.items() if len(self.postings[t]) <= max_df}
+        if rare:
+            q_terms = Counter(rare)
+        scores: Dict[int, float] = defaultdict(float)
+        for term, tf in q_terms.items():
+            q_weight = (1 + math.log(tf)) * self.idf[term]
+            for doc, d_weight in self.postings[term]:
+                scores[doc] += q_weight * d_weight
+        best = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+        return [self.issues[doc] for doc, _ in best]
@@ -0,0 +1,110 @@
+"""
+Per-run timing and counters.
+
+``RunMetrics.phase`` times a block of work (wall clock and the calling
+thread's CPU time) under a name; entering the same phase again adds to it,
+so phases that run in batches such as ``save`` accumulate. Counters record
+how much work the run did. ``summary`` is written as JSON and, optionally,
+as a Prometheus textfile for node_exporter's textfile collector.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+PROMETHEUS_PREFIX = "watcher_failure"
+
+
+class RunMetrics:
+    """Thread-safe phase timers and counters for one run."""
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Counter = Counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and add it to phase *name*."""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def add_time(self, name: str, wall: float, cpu: float = 0.0) -> None:
+        with self._lock:
+            entry = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            entry["wall"] += wall
+            entry["cpu"] += cpu
+            entry["calls"] += 1
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": round(time.perf_counter() - self._start, 6),
+                "phases": {
+                    name: {"wall": round(p["wall"], 6), "cpu": round(p["cpu"], 6), "calls": p["calls"]}
+                    for name, p in self.phases.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    # output ------------------------------------------------------------
+    def write_json(self, path: str | Path) -> None:
+        _write_atomic(Path(path), json.dumps(self.summary(), indent=2, sort_keys=True) + "\n")
+
+    def write_prometheus(self, path: str | Path) -> None:
+        """Write the summary in the Prometheus text exposition format."""
+        summary = self.summary()
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {p}_run_timestamp_seconds Start time of the last run.",
+            f"# TYPE {p}_run_timestamp_seconds gauge",
+            f"{p}_run_timestamp_seconds {summary['started_at']:.3f}",
+            f"# HELP {p}_run_duration_seconds Wall-clock duration of the last run.",
+            f"# TYPE {p}_run_duration_seconds gauge",
+            f"{p}_run_duration_seconds {summary['wall_seconds']}",
+        ]
+        for metric, key, help_text in (
+            ("phase_wall_seconds", "wall", "Wall-clock time spent per phase."),
+            ("phase_cpu_seconds", "cpu", "CPU time of the thread running each phase."),
+        ):
+            lines.append(f"# HELP {p}_{metric} {help_text}")
+            lines.append(f"# TYPE {p}_{metric} gauge")
+            for name, values in sorted(summary["phases"].items()):
+                lines.append(f'{p}_{metric}{{phase="{name}"}} {values[key]}')
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+        _write_atomic(Path(path), "\n".join(lines) + "\n")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    # readers (node_exporter, dashboards) never see a half-written file
+    path = path.expanduser()
+    fd, tmp = tempfile.mkstemp(dir=path.parent or ".", prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
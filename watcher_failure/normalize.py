@@ -0,0 +1,78 @@
+"""
+Failure-string normalization shared by LogParser and RedmineConnector.
+
+All patterns are compiled once at import, and every entry point is
+LRU-cached on the raw string: the same failure text shows up for hundreds
+of jobs in a scan, so most calls are a dictionary hit.
+"""
+import re
+from functools import lru_cache
+
+from .reason_conversion import (
+    reason_conversion,
+    reason_prefix_conversion,
+    reason_substring_conversion,
+)
+from .reason_matcher import ReasonMatcher
+
+CACHE_SIZE = 65536
+
+# machine-specific details in scrape.log lines
+SMITHI_RE   = re.compile(r'smithi\d+')
+CEPH_REF_RE = re.compile(r'CEPH_REF=[a-f0-9]+')
+
+# search clean-up for the Redmine query
+ISO_TS_RE      = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9:.+-]+\s+")
+DAEMON_ID_RE   = re.compile(r"\b(?:osd|mon|mgr|mds)\.[A-Za-z0-9_-]+\b")
+BRACKETS_RE    = re.compile(r"[(){}]")
+PUNCTUATION_RE = re.compile(r"[()@:;\\\[\\]]")
+WHITESPACE_RE  = re.compile(r"\s+")
+# <*> placeholders of clustered reason templates
+WILDCARD_RE    = re.compile(r"<\*>")
+
+# exact, prefix and substring conversion rules, compiled once
+REASON_MATCHER = ReasonMatcher(
+    reason_conversion, reason_prefix_conversion, reason_substring_conversion)
+
+
+def convert_reason(long_reason: str) -> str:
+    """
+    Map a raw failure message to a concise reason using predefined mappings:
+    an exact rule first, then the longest prefix rule, then the longest
+    substring rule.
+    """
+    return REASON_MATCHER.convert(long_reason)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_machine_name(log_string: str) -> str:
+    """
+    Normalize machine-specific details in a log string for consistent grouping.
+    """
+    s = SMITHI_RE.sub('smithi000', log_string)
+    s = CEPH_REF_RE.sub('CEPH_REF=XXXXXXXXXXXXXXXXXX', s)
+    return s
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonical_reason(raw: str) -> str:
+    """Full LogParser pipeline: machine-name normalization, then conversion."""
+    return convert_reason(normalize_machine_name(raw))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_for_search(reason: str) -> str:
+    """Best-effort clean-up so a Redmine search hits the important *words* only."""
+    # template placeholders carry no searchable words
+    reason = WILDCARD_RE.sub(" ", reason)
+    # strip surrounding quotes
+    reason = reason.strip().lstrip("'\"").rstrip("'\"")
+    # leading ISO timestamp
+    reason = ISO_TS_RE.sub("", reason)
+    # daemon / host identifiers (osd.12, mon.foo123, mds.a, mgr.x) and the
+    # (){} around them
+    reason = DAEMON_ID_RE.sub("", reason)
+    reason = BRACKETS_RE.sub("", reason)
+    # stray punctuation that only creates tokens
+    reason = PUNCTUATION_RE.sub(" ", reason)
+    return WHITESPACE_RE.sub(" ", reason).strip()
@@ -0,0 +1,225 @@
+"""
+Bulk writer feeding failure records to a PostgREST endpoint.
+
+Records are posted as JSON arrays of ``batch_size`` rows, the same way
+``pref_ci/find_teuthology_cbt.py`` posts CBT results, from a background
+thread so the scan does not wait on the network. ``save`` blocks once
+``queue_size`` batches are waiting, which slows the scan down to what the
+server accepts instead of buffering without bound. Connection errors,
+timeouts, 429 and 5xx responses are retried with exponential backoff.
+
+The endpoint is expected to expose a table like::
+
+    CREATE TABLE watcher_failures (
+        id        bigserial PRIMARY KEY,
+        host      text NOT NULL,
+        directory text NOT NULL,
+        version   text,
+        flavor    text,
+        date      date,
+        reason    text,
+        job_id    text
+    );
+    CREATE INDEX ON watcher_failures (directory);
+    CREATE INDEX ON watcher_failures (version, flavor, date);
+"""
+import base64
+import json
+import logging
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .failure_scanner import FailureRecord, RecordBatch
+from .failure_storage import FailureWriter
+
+log = logging.getLogger(__name__)
+
+# responses worth sending the same request again for
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# directories per DELETE request, to keep the query string short
+PURGE_CHUNK = 50
+# tells the sender thread to finish
+_STOP = object()
+
+
+class PostgrestFailureWriter(FailureWriter):
+    """Posts failure rows to `url` in batches from a background thread."""
+
+    def __init__(
+        self,
+        url: str,
+        auth: Optional[Tuple[str, str]] = None,
+        token: Optional[str] = None,
+        batch_size: int = 1000,
+        queue_size: int = 8,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+        host: Optional[str] = None,
+    ) -> None:
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        # rows are tagged with the host that scanned them
+        self.host = host or socket.gethostname()
+        self._headers = {
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal",
+        }
+        if token:
+            self._headers["Authorization"] = f"Bearer {token}"
+        elif auth:
+            creds = base64.b64encode(f"{auth[0]}:{auth[1]}".encode()).decode()
+            self._headers["Authorization"] = f"Basic {creds}"
+        # one sender keeps purges ahead of the inserts that follow them
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+        # rows saved since the last full batch went out
+        self._pending: List[Dict[str, Any]] = []
+        # after a batch exhausts its retries the server is treated as down
+        # and the rest of the run's batches are dropped without waiting
+        self._broken = False
+        self.stats: Dict[str, int] = {
+            "rows_sent": 0, "rows_failed": 0, "requests": 0, "retries": 0,
+        }
+
+    # FailureWriter -----------------------------------------------------
+    def setup(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="postgrest-writer", daemon=True)
+            self._thread.start()
+
+    def save(self, records: Iterable[FailureRecord]) -> int:
+        """
+        Queue the records for upload in batches of batch_size rows; a
+        partial batch waits for the next save (or close). Blocks while the
+        queue is full.
+        """
+        if self._thread is None:
+            raise RuntimeError("Writer not started. Call setup() first.")
+        rows = records.rows() if isinstance(records, RecordBatch) else (
+            (rec.directory, rec.version, rec.flavor, rec.date, rec.reason, rec.job_id, rec.template_id)
+            for rec in records
+        )
+        total = 0
+        while True:
+            chunk = [
+                {
+                    "host": self.host, "directory": directory, "version": version,
+                    "flavor": flavor, "date": date, "reason": reason, "job_id": job_id,
+                }
+                # template ids are local to each host's DB, so they stay there
+                for directory, version, flavor, date, reason, job_id, _
+                in islice(rows, self.batch_size - len(self._pending))
+            ]
+            if not chunk:
+                return total
+            self._pending.extend(chunk)
+            total += len(chunk)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def purge_directories(self, directories: List[str]) -> None:
+        if self._thread is None:
+            raise RuntimeError("Writer not started. Call setup() first.")
+        # rows saved before the purge are sent before it
+        self._flush()
+        for i in range(0, len(directories), PURGE_CHUNK):
+            self._queue.put(("DELETE", directories[i:i + PURGE_CHUNK]))
+
+    def close(self) -> None:
+        """Wait until every queued batch was sent (or given up on)."""
+        if self._thread is None:
+            return
+        self._flush()
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        log.info("Uploaded %d failure rows to %s (%d failed, %d requests, %d retries)",
+                 self.stats["rows_sent"], self.url, self.stats["rows_failed"],
+                 self.stats["requests"], self.stats["retries"])
+
+    def lost_writes(self) -> bool:
+        # once broken, every later batch and purge is dropped
+        return self._broken
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._queue.put(("POST", self._pending))
+            self._pending = []
+
+    # sender thread -----------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            method, payload = item
+            if method == "POST":
+                self._send_batch(payload)
+            else:
+                self._purge(payload)
+
+    def _send_batch(self, rows: List[Dict[str, Any]]) -> None:
+        if self._broken:
+            self.stats["rows_failed"] += len(rows)
+            return
+        body = json.dumps(rows, separators=(",", ":")).encode()
+        try:
+            self._request("POST", self.url, body)
+            self.stats["rows_sent"] += len(rows)
+        except Exception as exc:
+            self.stats["rows_failed"] += len(rows)
+            self._give_up(exc)
+
+    def _purge(self, directories: List[str]) -> None:
+        if self._broken:
+            return
+        # PostgREST filter: directory=in.("a","b")
+        quoted = ",".join('"' + d.replace('\\', '\\\\').replace('"', '\\"') + '"' for d in directories)
+        query = urllib.parse.urlencode({"directory": f"in.({quoted})", "host": f"eq.{self.host}"})
+        try:
+            self._request("DELETE", f"{self.url}?{query}", None)
+        except Exception as exc:
+            self._give_up(exc)
+
+    def _give_up(self, exc: Exception) -> None:
+        log.error("Upload to %s failed: %s; dropping the remaining uploads", self.url, exc)
+        self._broken = True
+
+    def _request(self, method: str, url: str, body: Optional[bytes]) -> None:
+        for attempt in range(self.max_retries + 1):
+            retry_after: Optional[float] = None
+            try:
+                self.stats["requests"] += 1
+                req = urllib.request.Request(url, data=body, headers=self._headers, method=method)
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    resp.read()
+                return
+            except urllib.error.HTTPError as exc:
+                detail = exc.read().decode(errors="replace")[:200]
+                if exc.code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise RuntimeError(f"{method} failed ({exc.code}): {detail}") from exc
+                header = exc.headers.get("Retry-After") if exc.headers else None
+                if header and header.isdigit():
+                    retry_after = float(header)
+                log.warning("%s %s returned %d, retrying", method, self.url, exc.code)
+            except (urllib.error.URLError, socket.timeout, ConnectionError) as exc:
+                if attempt == self.max_retries:
+                    raise
+                log.warning("%s %s failed (%s), retrying", method, self.url, exc)
+            self.stats["retries"] += 1
+            # exponential backoff with jitter, unless the server said when
+            if retry_after is None:
+                retry_after = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            time.sleep(retry_after)
@@ -0,0 +1,146 @@
+"""
+Incremental clustering of failure reasons into templates.
+
+Reasons that differ only by a PG id, pool name, timestamp, address or path
+are collapsed into one template such as ``pg <*> is stuck inactive``, using
+a Drain-style fixed-depth prefix tree: masked messages are bucketed by
+token count and their leading tokens, then matched against the few
+templates in that bucket by position-wise token similarity. Each reason
+costs O(tokens x templates in its bucket), and repeated reasons are a dict
+lookup.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WILDCARD = "<*>"
+
+# masking rules, applied in order; each turns a variable field into <*>
+MASKS = [
+    re.compile(r"\d{4}-\d{2}-\d{2}[T ][0-9:.]+(?:[+-]\d{4}|Z)?"),   # timestamps
+    re.compile(r"(?<![\w/])(?:/[\w.@:+-]+)+/?"),                      # paths
+    re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b"),             # IPv4[:port]
+    re.compile(r"\b0x[0-9a-fA-F]+\b"),                                 # hex literals
+    re.compile(r"\b[0-9a-f]{8,}\b"),                                   # sha1s, uuids parts
+    re.compile(r"\b[\w-]+(?:\.[\w-]+)*\.(?:com|net|org|local)\b"),   # hostnames
+    re.compile(r"\b\d+(?:\.[0-9a-f]+)?\b"),                            # numbers, pg ids
+]
+
+# a message joins a template when at least this share of positions match
+SIMILARITY_THRESHOLD = 0.7
+# leading tokens used to pick the bucket below the token-count level; merges
+# never wildcard these, so a template always stays reachable from its bucket
+PREFIX_DEPTH = 1
+# buckets hold at most this many templates before new ones are refused
+MAX_TEMPLATES_PER_BUCKET = 100
+
+
+def mask_reason(reason: str) -> str:
+    """Replace the variable fields of *reason* with ``<*>``."""
+    for pattern in MASKS:
+        reason = pattern.sub(WILDCARD, reason)
+    return reason
+
+
+class _Template:
+    __slots__ = ('id', 'tokens')
+
+    def __init__(self, template_id: int, tokens: List[str]) -> None:
+        self.id = template_id
+        self.tokens = tokens
+
+    def similarity(self, tokens: List[str]) -> Tuple[float, int]:
+        same = wildcards = 0
+        for mine, theirs in zip(self.tokens, tokens):
+            if mine == WILDCARD:
+                wildcards += 1
+            elif mine == theirs:
+                same += 1
+        return same / len(tokens), wildcards
+
+    def merge(self, tokens: List[str]) -> bool:
+        changed = False
+        for i, (mine, theirs) in enumerate(zip(self.tokens, tokens)):
+            if mine != theirs and mine != WILDCARD:
+                self.tokens[i] = WILDCARD
+                changed = True
+        return changed
+
+
+class ReasonClusterer:
+    """
+    Assigns every reason a stable template id. Seed it with the templates
+    and reason mapping from a previous run so ids survive across runs.
+    """
+
+    def __init__(
+        self,
+        templates: Optional[Dict[int, str]] = None,
+        reason_map: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self._tree: Dict[int, Dict[Tuple[str, ...], List[_Template]]] = {}
+        self._by_id: Dict[int, _Template] = {}
+        self._reason_ids: Dict[str, int] = dict(reason_map or {})
+        # ids whose template text changed or that are new, for persistence
+        self.dirty_templates: Dict[int, str] = {}
+        self.dirty_reasons: Dict[str, int] = {}
+        for template_id, text in sorted((templates or {}).items()):
+            self._insert(_Template(template_id, text.split()))
+        self._next_id = max(self._by_id, default=0) + 1
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def template(self, template_id: int) -> str:
+        return " ".join(self._by_id[template_id].tokens)
+
+    def templates(self) -> Dict[int, str]:
+        return {tid: " ".join(t.tokens) for tid, t in self._by_id.items()}
+
+    def assign(self, records: Iterable) -> None:
+        """Set ``template_id`` on each FailureRecord (or RecordBatch row) from its reason."""
+        if hasattr(records, "assign_templates"):
+            records.assign_templates(self.cluster)
+            return
+        for rec in records:
+            rec.template_id = self.cluster(rec.reason)
+
+    def cluster(self, reason: str) -> int:
+        """Return the template id of *reason*, learning a template if needed."""
+        template_id = self._reason_ids.get(reason)
+        if template_id is not None:
+            return template_id
+
+        tokens = mask_reason(reason).split() or [WILDCARD]
+        bucket = self._bucket(tokens)
+        best: Optional[_Template] = None
+        best_key = (-1.0, -1)
+        for candidate in bucket:
+            sim, wildcards = candidate.similarity(tokens)
+            if sim >= SIMILARITY_THRESHOLD and (sim, wildcards) > best_key:
+                best, best_key = candidate, (sim, wildcards)
+
+        if best is None:
+            best = _Template(self._next_id, list(tokens))
+            self._next_id += 1
+            if len(bucket) < MAX_TEMPLATES_PER_BUCKET:
+                bucket.append(best)
+            self._by_id[best.id] = best
+            self.dirty_templates[best.id] = " ".join(best.tokens)
+        elif best.merge(tokens):
+            self.dirty_templates[best.id] = " ".join(best.tokens)
+
+        self._reason_ids[reason] = best.id
+        self.dirty_reasons[reason] = best.id
+        return best.id
+
+    def _bucket(self, tokens: List[str]) -> List[_Template]:
+        # tokens containing digits are too variable to route on
+        prefix = tuple(
+            WILDCARD if any(c.isdigit() for c in tok) else tok
+            for tok in tokens[:PREFIX_DEPTH]
+        )
+        return self._tree.setdefault(len(tokens), {}).setdefault(prefix, [])
+
+    def _insert(self, template: _Template) -> None:
+        self._bucket(template.tokens).append(template)
+        self._by_id[template.id] = template
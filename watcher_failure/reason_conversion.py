@@ -2,4 +2,16 @@ reason_conversion = {
     "test_failure_example_long_reason_1": "HTTP://example_short_reason_1",
     "another_long_reason_for_failure": "HTTP://short_reason_2",
     # Add more mappings as needed
-}
\ No newline at end of file
+}
+
+# reasons starting with the key; the longest matching prefix wins
+reason_prefix_conversion = {
+    # "Command failed (workunit test rados/test.sh)": "HTTP://short_reason",
+}
+
+# reasons containing the key anywhere; the longest matching substring wins,
+# then the entry listed first. Only consulted when no exact or prefix rule
+# matches.
+reason_substring_conversion = {
+    # "SELinux denials found on ubuntu@": "HTTP://short_reason",
+}
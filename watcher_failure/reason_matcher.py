@@ -0,0 +1,134 @@
+"""
+Single-pass matching of failure reasons against the conversion rules.
+
+``reason_conversion.py`` holds three rule tables: exact reasons, reason
+prefixes and substrings. Prefix rules live in a character trie and
+substring rules in an Aho-Corasick automaton, both built once at import,
+so a reason is checked against every rule in one walk over its characters
+instead of one ``str.startswith`` / ``in`` / regex test per rule.
+"""
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# a match is (pattern length, -rule index, replacement): the longest pattern
+# wins and, among equally long ones, the rule listed first in its table
+_Match = Tuple[int, int, str]
+
+# trie key marking the end of a prefix rule; never a single character
+_END = ""
+
+
+class PrefixTrie:
+    """Finds the longest rule that *text* starts with."""
+
+    def __init__(self, rules: Dict[str, str]) -> None:
+        self._root: Dict[str, dict] = {}
+        for prefix, replacement in rules.items():
+            if not prefix:
+                continue
+            node = self._root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            # first rule listed wins on duplicate prefixes
+            node.setdefault(_END, replacement)
+
+    def match(self, text: str) -> Optional[str]:
+        node = self._root
+        found = None
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return found
+
+
+class AhoCorasick:
+    """Finds the longest rule that occurs anywhere in *text*."""
+
+    def __init__(self, rules: Dict[str, str]) -> None:
+        # state 0 is the root; goto[s] maps a character to the next state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # best rule ending at each state, following failure links included
+        self._best: List[Optional[_Match]] = [None]
+
+        for index, (pattern, replacement) in enumerate(rules.items()):
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                state = nxt
+            match = (len(pattern), -index, replacement)
+            if self._best[state] is None or match > self._best[state]:
+                self._best[state] = match
+
+        # breadth-first over the trie so failure targets are finished first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                inherited = self._best[self._fail[nxt]]
+                if inherited is not None and (self._best[nxt] is None or inherited > self._best[nxt]):
+                    self._best[nxt] = inherited
+                queue.append(nxt)
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def match(self, text: str) -> Optional[str]:
+        goto, fail, best_at = self._goto, self._fail, self._best
+        state = 0
+        best: Optional[_Match] = None
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            found = best_at[state]
+            if found is not None and (best is None or found > best):
+                best = found
+        return best[2] if best is not None else None
+
+
+class ReasonMatcher:
+    """
+    Applies the conversion tables in order of specificity: an exact match
+    first, then the longest matching prefix, then the longest substring.
+    Reasons no rule matches come back unchanged.
+    """
+
+    def __init__(
+        self,
+        exact: Dict[str, str],
+        prefixes: Optional[Dict[str, str]] = None,
+        substrings: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self._exact = exact
+        self._prefixes = PrefixTrie(prefixes) if prefixes else None
+        self._substrings = AhoCorasick(substrings) if substrings else None
+
+    def convert(self, reason: str) -> str:
+        converted = self._exact.get(reason)
+        if converted is not None:
+            return converted
+        if self._prefixes is not None:
+            converted = self._prefixes.match(reason)
+            if converted is not None:
+                return converted
+        if self._substrings is not None:
+            converted = self._substrings.match(reason)
+            if converted is not None:
+                return converted
+        return reason
@@ -1,33 +1,154 @@
-from .failure_scanner import FailureRecord
+from .failure_scanner import FailureRecord, RecordBatch
+from .failure_storage import ReasonTrend
+from .metrics import RunMetrics
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import date, timedelta
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import logging
 
 log = logging.getLogger(__name__)
 
+# a reason is flagged as a regression when its latest window grew by at
+# least this many failures and this factor over the window before
+REGRESSION_MIN_DELTA = 3
+REGRESSION_MIN_RATIO = 1.5
+# regressions / new reasons listed per version and flavor
+TREND_LINES = 5
+
 class ReportBuilder:
     """
     Takes raw stats and conversion/tracker data,
     builds an email-friendly subject, body, and inline images mapping.
     """
-    def __init__(self, cfg) -> None:
+    def __init__(self, cfg, metrics: Optional[RunMetrics] = None, connector=None) -> None:
+        """
+        `connector` replaces the RedmineConnector built from cfg; it needs
+        lookup_cached, search_and_refine, flush and stats (benchmarks pass
+        a stub so no tracker is contacted).
+        """
         self.cfg = cfg
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        if connector is not None:
+            self.connector = connector
+        else:
+            self.connector = self._connect(cfg)
+        # tracker lookups in flight, shared by prefetch_async and prefetch_issues
+        self._lookup_pool: Optional[ThreadPoolExecutor] = None
+        self._lookups: Dict[str, Future] = {}
+
+    def _connect(self, cfg):
         # RedmineConnector for mapping reasons to issue links
         log.debug("tracker_cache_file: %s", cfg.tracker_cache_file)
         from .trackers import RedmineConnector
-        self.connector = RedmineConnector(
+        connector = RedmineConnector(
             config_path=cfg.redmine_config_path,
             cache_file=cfg.tracker_cache_file,
+            timeout=cfg.tracker_timeout,
+            positive_ttl=cfg.tracker_cache_ttl,
+            negative_ttl=cfg.tracker_cache_negative_ttl,
+            max_entries=cfg.tracker_cache_max_entries,
+            index_file=cfg.tracker_index_file,
+            offline=cfg.tracker_offline and not cfg.sync_tracker_index,
         )
+        if cfg.sync_tracker_index:
+            with self.metrics.phase("tracker_sync"):
+                connector.sync_index()
+            if cfg.tracker_offline:
+                connector.load_index()
+        return connector
+
+    def prefetch_async(self, reasons: Iterable[str], limit: Optional[int] = None) -> int:
+        """
+        Start tracker lookups for `reasons` in the background and return
+        immediately; a later prefetch_issues picks up the results instead of
+        searching again. Reasons already cached or in flight are skipped.
+        Starts at most `limit` lookups; returns how many were started.
+        """
+        started = 0
+        for reason in reasons:
+            if limit is not None and started >= limit:
+                break
+            if reason not in self._lookups and self.connector.lookup_cached(reason, count=False) is None:
+                self._submit_lookup(reason)
+                started += 1
+        return started
+
+    def _submit_lookup(self, reason: str) -> Future:
+        fut = self._lookups.get(reason)
+        if fut is None:
+            if self._lookup_pool is None:
+                self._lookup_pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.cfg.tracker_workers),
+                    thread_name_prefix="tracker",
+                )
+            fut = self._lookup_pool.submit(self.connector.search_and_refine, reason)
+            self._lookups[reason] = fut
+        return fut
+
+    def prefetch_issues(self, reasons: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Resolve each distinct reason to its tracker issue. Cache hits are
+        answered inline; misses are looked up concurrently on a pool of
+        cfg.tracker_workers threads, reusing any lookup prefetch_async
+        already started. A failed lookup resolves to {}.
+        """
+        with self.metrics.phase("tracker"):
+            return self._prefetch_issues(reasons)
+
+    def _prefetch_issues(self, reasons: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        issues: Dict[str, Dict[str, Any]] = {}
+        misses: List[str] = []
+        for reason in dict.fromkeys(reasons):
+            cached = self.connector.lookup_cached(reason)
+            if cached is None:
+                misses.append(reason)
+            else:
+                issues[reason] = cached
+        log.debug("Tracker prefetch: %d cached, %d to look up", len(issues), len(misses))
+        # speculative lookups still queued for reasons that did not make the
+        # report would only delay the ones it needs
+        wanted = set(misses)
+        for reason, fut in list(self._lookups.items()):
+            if reason not in wanted and fut.cancel():
+                del self._lookups[reason]
+        futures = {self._submit_lookup(r): r for r in misses}
+        for fut in as_completed(futures):
+            reason = futures[fut]
+            try:
+                issues[reason] = fut.result()
+            except Exception as exc:
+                log.warning("Tracker lookup failed for '%s': %s", reason, exc)
+                issues[reason] = {}
+        self.close()
+        return issues
+
+    def close(self) -> None:
+        """
+        Drop speculative lookups that have not started, wait for running
+        ones (their results still land in the cache) and flush the cache.
+        """
+        for fut in self._lookups.values():
+            fut.cancel()
+        if self._lookup_pool is not None:
+            self._lookup_pool.shutdown(wait=True)
+            self._lookup_pool = None
+        self._lookups.clear()
+        self.connector.flush()
 
     def build(
         self,
         stats_by_vf: Dict[str, Dict[str, Dict[str,int]]],
         scanned_dirs: Dict[str,Dict[str,List[str]]],
-        records: List[FailureRecord],
+        records: Iterable[FailureRecord],
+        templates: Optional[Dict[int, str]] = None,
+        trends_by_vf: Optional[Dict[str, Dict[str, Dict[str, ReasonTrend]]]] = None,
     ) -> Tuple[str,str,Dict[str,str]]:
         """
-        Build email subject, body text, and image CID mapping.
+        Build email subject, body text, and image CID mapping. When reasons
+        were clustered, `templates` maps template ids to the template text
+        the statistics are keyed by. `trends_by_vf`, shaped like
+        `stats_by_vf` with FailureStorage.fetch_trends results, adds a
+        section flagging regressions and new reasons.
         """
         end_date = date.today()
         start_date = end_date - timedelta(days=self.cfg.days)
@@ -42,9 +163,8 @@ class ReportBuilder:
 
         # 2) single‐dir mode?
         if not self.cfg.bot:
-            job_ids_by_reason: Dict[str,List[str]] = {}
-            for rec in records:
-                job_ids_by_reason.setdefault(rec.reason, []).append(rec.job_id)
+            job_ids_by_reason = RecordBatch.from_records(records).job_ids_by(
+                lambda reason, template_id: (templates or {}).get(template_id, reason))
 
             # there should only be one key in scanned_dirs
             subject = f"Report for directory: {self.cfg.log_directory}"
@@ -72,8 +192,9 @@ class ReportBuilder:
             lines.append("")
             lines.append("Top failures:")
             if flat:
+                issues = self.prefetch_issues(flat)
                 for idx, (reason, cnt) in enumerate(flat.items(), start=1):
-                    issue = self.connector.search_and_refine(reason)
+                    issue = issues.get(reason, {})
                     link = issue.get("link") or f"Issue {issue.get('issue_id','')}"
                     lines.append(f"  {idx}. {reason} ({cnt}) → {link}")
                     ids = job_ids_by_reason.get(reason, [])
@@ -82,11 +203,23 @@ class ReportBuilder:
             else:
                 lines.append("  (no failures found)")
 
+            if trends_by_vf is not None:
+                trends = trends_by_vf.get(dir_key, {}).get(self.cfg.flavor, {})
+                lines.append("")
+                lines.extend(self._trend_lines(trends, indent="  "))
+
             return subject, "\n".join(lines), {}
 
         # 3) bot (tree) mode
         else:
             log.debug("Building report for bot mode scanned directories %s", scanned_dirs)
+            # resolve every reason we are about to print in one concurrent pass
+            issues = self.prefetch_issues(
+                reason
+                for version in self.cfg.versions
+                for flavor in self.cfg.flavors
+                for reason, _ in self._top_failures(stats_by_vf.get(version, {}).get(flavor, {}))
+            )
             for version in self.cfg.versions:
                 # figure out if any flavor under this version has data
                 version_lines: List[str] = []
@@ -112,15 +245,19 @@ class ReportBuilder:
 
                     if failures:
                         version_lines.append("   Top failures:")
-                        top10 = sorted(failures.items(), key=lambda x: -x[1])[:10]
+                        top10 = self._top_failures(failures)
                         for i,(reason,count) in enumerate(top10, start=1):
-                            issue = self.connector.search_and_refine(reason)
+                            issue = issues.get(reason, {})
                             link  = issue.get("link") or f"Issue {issue.get('issue_id','?')}"
                             version_lines.append(f"     {i}. {reason} ({count}) → {link}")
                     else:
                         version_lines.append("   Top failures:")
                         version_lines.append("     (no failures found)")
 
+                    if trends_by_vf is not None:
+                        trends = trends_by_vf.get(version, {}).get(flavor, {})
+                        version_lines.extend(self._trend_lines(trends, indent="     ", header_indent="   "))
+
                     version_lines.append("")  # blank between flavors
 
                 if version_lines:
@@ -129,4 +266,37 @@ class ReportBuilder:
                     lines.extend(version_lines)
 
         body = "\n".join(lines)
-        return subject, body, {}
\ No newline at end of file
+        return subject, body, {}
+
+    def _trend_lines(
+        self,
+        trends: Dict[str, ReasonTrend],
+        indent: str,
+        header_indent: str = "",
+    ) -> List[str]:
+        """Regressions and new reasons, each with its per-window counts (oldest first)."""
+        lines = [f"{header_indent}Trends ({self.cfg.trend_windows} windows, oldest → newest):"]
+        if not trends:
+            lines.append(f"{indent}(no failures in the trend range)")
+            return lines
+        new = [(r, t) for r, t in trends.items() if t.is_new]
+        regressions = sorted(
+            (
+                (r, t) for r, t in trends.items()
+                if len(t.windows) > 1 and not t.is_new
+                and t.delta >= REGRESSION_MIN_DELTA
+                and t.windows[-1] >= REGRESSION_MIN_RATIO * t.windows[-2]
+            ),
+            key=lambda rt: -rt[1].delta,
+        )
+        for reason, trend in regressions[:TREND_LINES]:
+            lines.append(f"{indent}▲ {reason}: {trend.windows} (+{trend.delta})")
+        for reason, trend in new[:TREND_LINES]:
+            lines.append(f"{indent}NEW {reason}: {trend.windows} (since {trend.first_seen})")
+        if not regressions and not new:
+            lines.append(f"{indent}(no regressions or new failures)")
+        return lines
+
+    @staticmethod
+    def _top_failures(failures: Dict[str, int]) -> List[Tuple[str, int]]:
+        return sorted(failures.items(), key=lambda x: -x[1])[:10]
\ No newline at end of file
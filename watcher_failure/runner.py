@@ -1,47 +1,167 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import logging
-from .failure_scanner import FailureScanner
-from .failure_storage import FailureStorage
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+from .failure_scanner import FailureRecord, FailureScanner, RecordBatch
+from .failure_storage import FailureStorage, FailureWriter, ReasonTrend
 from .report_builder import ReportBuilder
 from .email_sender import EmailSender
 from .cleaner import Cleaner
+from .reason_clustering import ReasonClusterer
+from .metrics import RunMetrics
+from .postgrest_writer import PostgrestFailureWriter
 from pathlib import Path as _P
 
 log = logging.getLogger(__name__)
 
+# failures listed per version/flavor in the report
+TOP_FAILURES = 10
+# trend windows are weeks, so deltas read as week over week
+TREND_WINDOW_DAYS = 7
+# end-of-scan marker on the pipeline queue
+_DONE = object()
+# a reason is looked up early only once it stayed in a version/flavor's
+# running top failures for this many scrape.log files in a row, and at
+# most SPECULATE_CAP early lookups are started per version/flavor
+SPECULATE_STREAK = 3
+SPECULATE_CAP = TOP_FAILURES * 3 // 2
+
+
+class _Speculation:
+    """Running top failures of one version/flavor during a streamed scan."""
+
+    __slots__ = ("counts", "streaks", "started")
+
+    def __init__(self) -> None:
+        self.counts: Counter = Counter()
+        self.streaks: Dict[str, int] = {}
+        self.started = 0
+
+
 class Runner:
     def __init__(self, cfg) -> None:
         self.cfg = cfg
+        self.metrics = RunMetrics()
         self.scanner = FailureScanner(cfg)
-        self.storage = FailureStorage(Path(cfg.db_name))
-        self.builder = ReportBuilder(cfg)
+        self.storage = FailureStorage(
+            Path(cfg.db_name),
+            batch_size=cfg.batch_size,
+            ephemeral=not cfg.keep_db,
+        )
+        # writers that receive the same records as the local DB; the report
+        # is always built from self.storage
+        self.writers: List[FailureWriter] = []
+        if cfg.store_url:
+            self.writers.append(PostgrestFailureWriter(
+                cfg.store_url,
+                auth=(cfg.store_user, cfg.store_password) if cfg.store_user else None,
+                token=cfg.store_token or None,
+                batch_size=cfg.store_batch_size,
+                max_retries=cfg.store_retries,
+            ))
+        self.builder = ReportBuilder(cfg, metrics=self.metrics)
         self.sender  = EmailSender(cfg)
         self.cleaner = Cleaner(cfg)
 
     def run(self) -> None:
+        metrics = self.metrics
         # 1. Setup DB
-        self.storage.setup()
-        # 2. Scan logs
+        with metrics.phase("setup"):
+            self.storage.setup()
+            for writer in self.writers:
+                writer.setup()
+            clusterer = None
+            if self.cfg.cluster_reasons:
+                # collapse near-duplicate reasons into templates as records are stored
+                clusterer = ReasonClusterer(*self.storage.load_templates())
+
+        # 2. Scan logs and store the records
         if self.cfg.bot:
-            grouped_records, scanned_dirs = self.scanner.scan_tree()
-            records = [
-                rec
-                for version_map in grouped_records.values()
-                for rec_list in version_map.values()
-                for rec in rec_list
-            ]
+            # records go straight to the DB; the bot report only needs stats
+            records = RecordBatch()
+            scanned_dirs = self._stream_tree(clusterer)
         else:
-            recs, dirs = self.scanner.scan_directory(_P(self.cfg.log_directory))
+            with metrics.phase("parse"):
+                recs, dirs = self.scanner.scan_directory(_P(self.cfg.log_directory))
             records = recs
             key = Path(self.cfg.log_directory).name
             scanned_dirs = { key: { self.cfg.flavor: dirs } }
+            log_file = _P(self.cfg.log_directory) / 'scrape.log'
+            if log_file.exists():
+                metrics.count("scrape_logs")
+                metrics.count("bytes_read", log_file.stat().st_size)
+            if clusterer is not None:
+                with metrics.phase("cluster"):
+                    clusterer.assign(records)
+            with metrics.phase("save"):
+                metrics.count("records", self.storage.save(records))
+            with metrics.phase("upload_queue"):
+                for writer in self.writers:
+                    writer.purge_directories(dirs)
+                    writer.save(records)
+        metrics.count("directories", sum(
+            len(dirs) for flavor_map in scanned_dirs.values() for dirs in flavor_map.values()))
 
         #log.debug("Scanned directories: %s", scanned_dirs)
         #log.debug("Parsed records: ")
         #for rec in records:
         #    log.debug("record:      %s", rec)
 
-        self.storage.save(records)
+        # 3. Persist the reason templates
+        templates = None
+        if clusterer is not None:
+            with metrics.phase("save"):
+                self.storage.save_templates(clusterer.dirty_templates, clusterer.dirty_reasons)
+            templates = clusterer.templates()
+            metrics.count("templates", len(clusterer))
+            log.debug("Clustered reasons into %d templates", len(clusterer))
+
+        with metrics.phase("statistics"):
+            stats_by_vf = self._fetch_statistics(scanned_dirs)
+            trends_by_vf = self._fetch_trends(scanned_dirs) if self.cfg.trend_windows else None
+
+        with metrics.phase("report"):
+            subject, body, images = self.builder.build(
+                stats_by_vf, scanned_dirs, records, templates=templates, trends_by_vf=trends_by_vf)
+
+        log.info("********************* Sending report ********************")
+        log.info("Subject: %s", subject)
+        log.info("%s", body)
+        log.info("******************** End of report ********************")
+
+        if self.cfg.email:
+            with metrics.phase("email"):
+                self.sender.send(subject, body, images)
+
+        if self.writers:
+            # waits for the uploads still queued; a failing store is logged
+            # by its writer and never fails the run
+            with metrics.phase("upload"):
+                for writer in self.writers:
+                    writer.close()
+
+        if self.scanner.new_runs:
+            # only once every writer has the runs' failures: a run marked
+            # processed is never parsed (or uploaded) again
+            lost = [w for w in self.writers if w.lost_writes()]
+            if lost:
+                log.error("Not marking %d runs processed: %d writer(s) dropped failures; "
+                          "they are parsed again next run", len(self.scanner.new_runs), len(lost))
+            else:
+                with metrics.phase("save"):
+                    self.storage.mark_processed(self.scanner.new_runs)
+
+        # 6. Cleanup
+        with metrics.phase("cleanup"):
+            self.storage.close()
+            self.cleaner.run()
+        log.debug("Cleanup completed")
+        self._write_metrics()
+
+    def _fetch_statistics(self, scanned_dirs: Dict[str, Dict[str, List[str]]]) -> Dict[str, Dict[str, Dict[str,int]]]:
         stats_by_vf: Dict[str, Dict[str, Dict[str,int]]] = {}
         if self.cfg.bot:
             log.debug("Running in tree mode")
@@ -54,23 +174,165 @@ class Runner:
                         flavor=flavor,
                         since_days=self.cfg.days,
                         error_msg=self.cfg.error_message,
-                        top_n=10,
+                        top_n=TOP_FAILURES,
+                        by_template=self.cfg.cluster_reasons,
                     )
 
         else:
-            stats = self.storage.fetch_statistics(top_n=10)
+            stats = self.storage.fetch_statistics(top_n=TOP_FAILURES, by_template=self.cfg.cluster_reasons)
+            key = Path(self.cfg.log_directory).name
             stats_by_vf[key] = {self.cfg.flavor: stats}
+        return stats_by_vf
 
-        subject, body, images = self.builder.build(stats_by_vf, scanned_dirs, records)
+    def _fetch_trends(self, scanned_dirs: Dict[str, Dict[str, List[str]]]) -> Dict[str, Dict[str, Dict[str, ReasonTrend]]]:
+        trends_by_vf: Dict[str, Dict[str, Dict[str, ReasonTrend]]] = {}
+        for key, flavor_map in scanned_dirs.items():
+            trends_by_vf[key] = {}
+            for flavor in flavor_map:
+                trends_by_vf[key][flavor] = self.storage.fetch_trends(
+                    # single-directory runs only hold that directory's failures
+                    version=key if self.cfg.bot else None,
+                    flavor=flavor if self.cfg.bot else None,
+                    windows=self.cfg.trend_windows,
+                    window_days=TREND_WINDOW_DAYS,
+                    error_msg=self.cfg.error_message if self.cfg.bot else None,
+                    by_template=self.cfg.cluster_reasons,
+                )
+        return trends_by_vf
 
-        log.info("********************* Sending report ********************")
-        log.info("Subject: %s", subject)
-        log.info("%s", body)
-        log.info("******************** End of report ********************")
+    def _write_metrics(self) -> None:
+        for name, value in self.builder.connector.stats.items():
+            self.metrics.count(f"tracker_{name}", value)
+        for writer in self.writers:
+            for name, value in getattr(writer, "stats", {}).items():
+                self.metrics.count(f"upload_{name}", value)
+        log.debug("Run metrics: %s", self.metrics.summary())
+        if self.cfg.metrics_file:
+            self.metrics.write_json(self.cfg.metrics_file)
+        if self.cfg.prometheus_file:
+            self.metrics.write_prometheus(self.cfg.prometheus_file)
 
-        if self.cfg.email:
-            self.sender.send(subject, body, images)
+    def _stream_tree(self, clusterer: Optional[ReasonClusterer]) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Scan, store and start tracker lookups as one pipeline: a scanner
+        thread parses scrape.log files into a bounded queue while this
+        thread (which owns the SQLite connection) saves the records in
+        batches and prefetches issues for reasons entering a
+        version/flavor's running top failures. Returns the scanned
+        directories grouped by version and flavor.
+        """
+        metrics = self.metrics
+        with metrics.phase("discovery"):
+            processed = self.storage.processed_runs() if self.cfg.incremental else None
+            pending, scanned_dirs = self.scanner.discover(processed)
+        metrics.count("scrape_logs", len(pending))
+        metrics.count("bytes_read", self.scanner.pending_bytes)
+        if self.scanner.new_runs:
+            # changed scrape.log files replace what an earlier run stored
+            with metrics.phase("save"):
+                self.storage.purge_directories([d for d, _, _ in self.scanner.new_runs])
+        if self.writers:
+            # the shared store keeps every run, so whatever is parsed again
+            # replaces its earlier upload
+            with metrics.phase("upload_queue"):
+                for writer in self.writers:
+                    writer.purge_directories([str(p.parent) for _, _, p in pending])
 
-        # 6. Cleanup
-        self.cleaner.run()
-        log.debug("Cleanup completed")
\ No newline at end of file
+        parsed: "queue.Queue" = queue.Queue(maxsize=max(1, self.cfg.queue_size))
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # blocks while the queue is full, unless the consumer gave up
+            while not stop.is_set():
+                try:
+                    parsed.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce() -> None:
+            try:
+                items = self.scanner.iter_parsed(pending)
+                while True:
+                    # time spent parsing, not waiting for room in the queue
+                    with metrics.phase("parse"):
+                        item = next(items, _DONE)
+                    if item is _DONE:
+                        break
+                    if not put(item):
+                        return
+            except BaseException as exc:
+                put(exc)    # re-raised by the consumer
+                return
+            put(_DONE)
+
+        producer = threading.Thread(target=produce, name="scanner", daemon=True)
+        producer.start()
+        speculation: Dict[Tuple[str, str], _Speculation] = defaultdict(_Speculation)
+        # the report filters on error_message, which the running counts can't
+        # see; early lookups would mostly be for reasons it never shows
+        speculate = not self.cfg.error_message
+        since = (datetime.now(timezone.utc).date() - timedelta(days=self.cfg.days)).isoformat()
+        batch = RecordBatch()
+        stored = 0
+        try:
+            while True:
+                # time the writer sat idle waiting for the parser
+                with metrics.phase("queue_wait"):
+                    item = parsed.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                version, flavor, _, recs = item
+                if clusterer is not None:
+                    with metrics.phase("cluster"):
+                        clusterer.assign(recs)
+                batch.extend(recs)
+                if self.writers:
+                    # blocks only while a writer's upload queue is full
+                    with metrics.phase("upload_queue"):
+                        for writer in self.writers:
+                            writer.save(recs)
+                if len(batch) >= self.cfg.batch_size:
+                    with metrics.phase("save"):
+                        stored += self.storage.save(batch)
+                    batch = RecordBatch()
+                if speculate:
+                    self._speculate(speculation[(version, flavor)], recs, clusterer, since)
+            with metrics.phase("save"):
+                stored += self.storage.save(batch)
+        finally:
+            stop.set()
+            producer.join()
+
+        metrics.count("records", stored)
+        log.debug("Stored %d records from %d scrape.log files", stored, len(pending))
+        return scanned_dirs
+
+    def _speculate(
+        self,
+        state: _Speculation,
+        recs: RecordBatch,
+        clusterer: Optional[ReasonClusterer],
+        since: str,
+    ) -> None:
+        # best effort: the report's top failures also cover earlier runs, so
+        # the final prefetch fills any gaps; reasons churning through the
+        # running top-N are not looked up, as the report may never show them
+        if not recs:
+            return
+        if clusterer is not None:
+            state.counts.update(recs.value_counts(
+                lambda _, template_id: clusterer.template(template_id), since=since))
+        else:
+            state.counts.update(recs.value_counts(since=since))
+        top = [reason for reason, _ in state.counts.most_common(TOP_FAILURES)]
+        state.streaks = {reason: state.streaks.get(reason, 0) + 1 for reason in top}
+        if state.started >= SPECULATE_CAP:
+            return
+        state.started += self.builder.prefetch_async(
+            (reason for reason in top if state.streaks[reason] >= SPECULATE_STREAK),
+            limit=SPECULATE_CAP - state.started,
+        )
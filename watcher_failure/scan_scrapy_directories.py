@@ -4,7 +4,7 @@ import re
 import datetime
 import logging
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
@@ -132,3 +132,112 @@ def scan_scrapy_directories(
         logging.exception("Error scanning directories")
 
     return results
+
+
+# one matcher for every version/flavor; the suite/version split of `middle`
+# is done in Python so the archive root only has to be listed once
+RUN_DIR_RE = re.compile(
+    r"^(?P<user>[^-]+)-"
+    r"(?P<date>\d{4}-\d{2}-\d{2})_[0-9]{2}:[0-9]{2}:[0-9]{2}-"
+    r"(?P<middle>.+?)"
+    r"(?P<release>-release)?-distro-"
+    r"(?P<flavor>[^-]+)-smithi$"
+)
+
+
+def classify_directory_name(
+    name: str,
+    versions: List[str],
+) -> Optional[Tuple[str, str, str, str, str]]:
+    """
+    Split a teuthology run directory name into
+    (user, date, suite, version, flavor), or return None if it does not
+    look like a run directory. `suite` is everything between the date and
+    the version (or -distro- for main); `version` is 'main' when none of
+    the other `versions` appears before -distro-, following the same rules
+    as scan_scrapy_directories.
+    """
+    m = RUN_DIR_RE.match(name)
+    if not m:
+        return None
+    middle = m.group("middle")
+    head, _, last = middle.rpartition("-")
+    if last in versions and last != "main" and head:
+        return m.group("user"), m.group("date"), head, last, m.group("flavor")
+
+    name_before_distro = name.split("-distro-")[0]
+    if any(f"-{ver}" in name_before_distro for ver in versions if ver != "main"):
+        return None
+    # main runs keep an optional -release in the suite part, like the
+    # lookahead in the per-version pattern does
+    suite = middle + (m.group("release") or "")
+    return m.group("user"), m.group("date"), suite, "main", m.group("flavor")
+
+
+def _suite_matches(suite: str, suite_name: str) -> bool:
+    # equivalent of `{suite_name}(?:-[^-]+)*`
+    return suite == suite_name or suite.startswith(suite_name + "-")
+
+
+def discover_scrapy_directories(
+    log_directory: str,
+    days: int,
+    versions: List[str],
+    flavors: Dict[str, Tuple[Union[str, List[str]], str]],
+    verbose: bool = False,
+) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Single-pass variant of scan_scrapy_directories for every version and
+    flavor at once. `flavors` maps each flavor to its (user_name, suite_name)
+    filter, where user_name accepts the same forms as in
+    scan_scrapy_directories. Returns { version: { flavor: [dir, ...] } } with
+    directories in scandir order.
+    """
+    base = Path(log_directory)
+    cutoff = datetime.date.today() - datetime.timedelta(days=days)
+    grouped: Dict[str, Dict[str, List[str]]] = {
+        version: {flavor: [] for flavor in flavors}
+        for version in versions
+    }
+
+    users_by_flavor: Dict[str, Optional[set]] = {}
+    for flavor, (user_name, _) in flavors.items():
+        names = user_name if isinstance(user_name, (list, tuple)) else [user_name]
+        users_by_flavor[flavor] = None if "*" in names else set(names)
+
+    try:
+        for entry in os.scandir(base):
+            parts = classify_directory_name(entry.name, versions)
+            if parts is None:
+                continue
+            user, date_str, suite, version, flavor = parts
+            if version not in grouped or flavor not in flavors:
+                continue
+            users = users_by_flavor[flavor]
+            if users is not None and user not in users:
+                continue
+            if not _suite_matches(suite, flavors[flavor][1]):
+                continue
+            try:
+                d = datetime.datetime.strptime(date_str, DATE_FMT).date()
+            except ValueError:
+                if verbose:
+                    logging.debug("Skipping %s: bad date %r", entry.name, date_str)
+                continue
+            if d < cutoff:
+                continue
+            # stat only the names that survived classification
+            if not entry.is_dir():
+                continue
+
+            full = str(base / entry.name)
+            if verbose:
+                logging.debug("Accepting directory: %s (%s/%s)", full, version, flavor)
+            grouped[version][flavor].append(full)
+
+    except FileNotFoundError:
+        logging.error("Log directory not found: %s", base)
+    except Exception:
+        logging.exception("Error scanning directories")
+
+    return grouped
@@ -9,21 +9,38 @@ Key features
   numbers, log‑level tags …) so the search query is generic but still
   meaningful.
 * Hit the Redmine `/search.json` API once, then pick the **closest** match based
-  on ``difflib.SequenceMatcher``.
+  on ``difflib.SequenceMatcher``. In offline mode the candidates come from a
+  local TF-IDF index over a synced issue dump instead (see ``issue_index``).
 * Tiny JSON cache so we don’t hammer Redmine when repeatedly processing the same
-  logs.
+  logs; new entries are written behind in batches and the file is replaced
+  atomically, so several watcher processes can share it. Entries expire
+  (“not found” much sooner than found issues) and the least recently used
+  ones are evicted beyond a size cap.
 """
 from __future__ import annotations
 
 import configparser
 import json
 import logging
-import re
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
 from difflib import SequenceMatcher
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover – non-POSIX
+    fcntl = None  # type: ignore[assignment]
 
 from redminelib import Redmine
+from redminelib.exceptions import ResourceAttrError
+
+from .issue_index import IssueIndex
+from .normalize import normalize_for_search
 
 logger = logging.getLogger(__name__)
 
@@ -38,15 +55,39 @@ class RedmineConnector:
         self,
         config_path: str | Path = "~/.redmin",
         cache_file: str | Path = "tracker_cache.json",
+        timeout: Optional[float] = None,
+        flush_every: int = 50,
+        flush_interval: float = 60.0,
+        positive_ttl: float = 30 * 86400,
+        negative_ttl: float = 86400,
+        max_entries: int = 5000,
+        index_file: Optional[str | Path] = None,
+        offline: bool = False,
     ) -> None:
         self.config = self._load_config(config_path)
+        # search_and_refine may be called from several threads at once
+        self._cache_lock = threading.Lock()
         self.cache_path = (
             Path(cache_file).expanduser()
             if not Path(cache_file).is_absolute()
             else Path(cache_file)
         )
         logger.debug("Using cache file: %s", self.cache_path)
-        self.cache: Dict[str, Any] = self._load_cache()
+        # found issues are trusted for positive_ttl seconds, "nothing found"
+        # only for negative_ttl so new tracker issues get picked up
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max(1, max_entries)
+        self._dirty: Set[str] = set()
+        self.cache = self._load_cache()
+        # cache_hits / cache_misses count lookup_cached calls, searches the
+        # queries sent to Redmine or the offline index
+        self.stats: Counter = Counter()
+        # write-behind: new entries are flushed after `flush_every` of them,
+        # `flush_interval` seconds, or an explicit flush()
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
 
         red_cfg = self.config["redmine"] if self.config.has_section("redmine") else {}
         logger.debug("   Redmine config: %s", red_cfg)
@@ -55,19 +96,94 @@ class RedmineConnector:
             red_cfg.get("url", "https://tracker.ceph.com"),
             username=red_cfg.get("username", ""),
             key=red_cfg.get("password", ""),
+            requests={"timeout": timeout} if timeout else {},
         )
 
-        project_name = red_cfg.get("project_name", "Ceph")
-        try:
-            self.project_id = self.redmine.project.get(project_name).id  # type: ignore[attr-defined]
-            logger.debug("Connected to Redmine project ID: %s", self.project_id)
-        except Exception as exc:  # pragma: no cover – network issue
-            logger.warning("Could not fetch Redmine project '%s': %s", project_name, exc)
-            self.project_id = None
+        # offline mode answers searches from a local issue dump instead of
+        # /search.json and never talks to Redmine
+        self.index_path = Path(index_file).expanduser() if index_file else None
+        self.index: Optional[IssueIndex] = None
+        self.project_name = red_cfg.get("project_name", "Ceph")
+        self.project_id = None
+        if offline:
+            self.load_index()
+        else:
+            try:
+                self.project_id = self.redmine.project.get(self.project_name).id  # type: ignore[attr-defined]
+                logger.debug("Connected to Redmine project ID: %s", self.project_id)
+            except Exception as exc:  # pragma: no cover – network issue
+                logger.warning("Could not fetch Redmine project '%s': %s", self.project_name, exc)
 
     # ---------------------------------------------------------------------
-    # public entry‑point                                                   |
+    # public entry‑points                                                  |
     # ---------------------------------------------------------------------
+    def lookup_cached(self, search_string: str, *, count: bool = True) -> Optional[Dict[str, Any]]:
+        """Return the cached result for *search_string*, or ``None`` on a miss
+        or when the entry has outlived its TTL. Pass ``count=False`` for
+        checks that should not show up in ``stats``."""
+        with self._cache_lock:
+            entry = self.cache.get(search_string)
+            if entry is not None and not self._is_fresh(entry, time.time()):
+                del self.cache[search_string]
+                # nothing left to persist for it
+                self._dirty.discard(search_string)
+                entry = None
+            if count:
+                self.stats["cache_hits" if entry is not None else "cache_misses"] += 1
+            if entry is None:
+                return None
+            self.cache.move_to_end(search_string)
+            return {k: v for k, v in entry.items() if k != "ts"}
+
+    def flush(self) -> None:
+        """Write any pending cache entries to disk."""
+        with self._cache_lock:
+            self._save_cache()
+
+    def load_index(self) -> None:
+        """Answer searches from the issue dump at ``index_path`` from now on."""
+        if self.index_path is None:
+            raise ValueError("offline mode needs an index_file")
+        start = time.monotonic()
+        self.index = IssueIndex.load(self.index_path)
+        logger.debug("Loaded %d issues from %s in %.2fs",
+                     len(self.index), self.index_path, time.monotonic() - start)
+
+    def sync_index(self) -> int:
+        """
+        Dump subject/description of every issue in the project to
+        ``index_path``; returns the number of issues written. Call
+        ``load_index`` afterwards to search the refreshed dump.
+        """
+        if self.index_path is None:
+            raise ValueError("no index_file configured")
+        if self.project_id is None:
+            self.project_id = self.redmine.project.get(self.project_name).id  # type: ignore[attr-defined]
+        logger.info("Syncing Redmine issues of project %s → %s", self.project_name, self.index_path)
+        issues = self.redmine.issue.filter(project_id=self.project_id, status_id="*")  # type: ignore[attr-defined]
+        count = IssueIndex.dump(
+            (
+                {
+                    "id": it.id,
+                    "subject": self._issue_field(it, "subject"),
+                    "description": self._issue_field(it, "description"),
+                }
+                for it in issues
+            ),
+            self.index_path,
+        )
+        logger.info("Synced %d issues", count)
+        return count
+
+    @staticmethod
+    def _issue_field(issue: Any, name: str) -> str:
+        # python-redmine raises ResourceAttrError (not AttributeError) for
+        # fields the API left out, e.g. an issue without a description
+        try:
+            return getattr(issue, name) or ""
+        except (ResourceAttrError, AttributeError):
+            return ""
+
     def search_and_refine(
         self,
         search_string: str,
@@ -80,35 +196,39 @@ class RedmineConnector:
             raise TypeError("search_string must be str")
 
         # 0. cheap cache look‑up ------------------------------------------------
-        if search_string in self.cache:
+        # callers such as ReportBuilder.prefetch_issues already counted this
+        cached = self.lookup_cached(search_string, count=False)
+        if cached is not None:
             logger.debug("Cache hit for '%s'", search_string)
-            return self.cache[search_string]
+            return cached
 
         # 1. normalise ----------------------------------------------------------
         q_norm = self._normalize_for_search(search_string)
+        with self._cache_lock:
+            self.stats["searches"] += 1
 
         # 2. fetch possible issues ---------------------------------------------
-        issues = self._fetch_issues(q_norm, status=status, limit=limit)
+        if self.index is not None:
+            issues = self.index.search(q_norm, limit=limit)
+        else:
+            issues = self._fetch_issues(q_norm, status=status, limit=limit)
         if not issues:
             logger.debug("No issues found for '%s'", search_string)
-            self.cache[search_string] = {}
-            self._save_cache()
+            self._store(search_string, {})
             return {}
 
         # 3. select the best match ---------------------------------------------
         best = self._find_best_match(q_norm, issues)
         if best is None:
             logger.debug("Could not identify a close enough Redmine issue for '%s'", search_string)
-            self.cache[search_string] = {}
-            self._save_cache()
+            self._store(search_string, {})
             return {}
 
         issue_id, score, link = best
         logger.debug("Selected issue %s (score %.02f)", issue_id, score)
 
         result = {"issue_id": issue_id, "link": link}
-        self.cache[search_string] = result
-        self._save_cache()
+        self._store(search_string, result)
         return result
 
     # ------------------------------------------------------------------
@@ -121,20 +241,89 @@ class RedmineConnector:
         return cfg
 
     # cache -------------------------------------------------------------
-    def _load_cache(self) -> Dict[str, Any]:
+    # on disk: {reason: {"issue_id": int, "link": str, "ts": float}}, or
+    # {"ts": float} for "no issue found", oldest (least recently used) first
+    def _is_fresh(self, entry: Dict[str, Any], now: float) -> bool:
+        ttl = self.positive_ttl if entry.get("issue_id") is not None else self.negative_ttl
+        return now - entry.get("ts", now) < ttl
+
+    def _load_cache(self) -> "OrderedDict[str, Dict[str, Any]]":
         try:
             with open(self.cache_path, "r", encoding="utf-8") as fh:
-                return json.load(fh)
+                raw = json.load(fh)
         except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            return OrderedDict()
+        now = time.time()
+        cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for key, entry in raw.items():
+            if not isinstance(entry, dict):
+                continue
+            # entries written before timestamps existed start their TTL now
+            entry.setdefault("ts", now)
+            if self._is_fresh(entry, now):
+                cache[key] = entry
+        return cache
+
+    def _evict(self, cache: "OrderedDict[str, Dict[str, Any]]") -> None:
+        while len(cache) > self.max_entries:
+            key, _ = cache.popitem(last=False)
+            self._dirty.discard(key)
+
+    def _store(self, search_string: str, result: Dict[str, Any]) -> None:
+        with self._cache_lock:
+            self.cache[search_string] = dict(result, ts=time.time())
+            self.cache.move_to_end(search_string)
+            self._dirty.add(search_string)
+            self._evict(self.cache)
+            if (len(self._dirty) >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._save_cache()
 
     def _save_cache(self) -> None:
+        """
+        Merge dirty entries into the on-disk cache and replace it atomically.
+        Caller holds ``_cache_lock``; an ``flock`` on a sidecar lock file
+        serialises concurrent watcher processes sharing the same cache.
+        Expired entries are dropped and the file is capped at max_entries.
+        """
+        if not self._dirty:
+            return
+        lock_path = self.cache_path.with_name(self.cache_path.name + ".lock")
         try:
-            with open(self.cache_path, "w", encoding="utf-8") as fh:
-                json.dump(self.cache, fh, indent=2)
-            logger.debug("Cache saved → %s", self.cache_path)
+            with open(lock_path, "a") as lock_fh:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                # another process may have flushed since we loaded
+                merged = self._load_cache()
+                for key in self._dirty:
+                    entry = self.cache.get(key)
+                    if entry is None:
+                        continue    # expired or evicted since it was stored
+                    merged[key] = entry
+                    merged.move_to_end(key)
+                self._evict(merged)
+                fd, tmp = tempfile.mkstemp(
+                    dir=self.cache_path.parent, prefix=self.cache_path.name, suffix=".tmp"
+                )
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                        json.dump(merged, fh, separators=(",", ":"))
+                        fh.flush()
+                        os.fsync(fh.fileno())
+                    os.replace(tmp, self.cache_path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+            for key, value in merged.items():
+                if key not in self.cache:
+                    self.cache[key] = value
+                    self.cache.move_to_end(key, last=False)
+            logger.debug("Cache saved (%d new entries) → %s", len(self._dirty), self.cache_path)
+            self._dirty.clear()
+            self._evict(self.cache)
         except Exception as exc:  # pragma: no cover – filesystem perms
             logger.warning("Could not persist cache: %s", exc)
+        self._last_flush = time.monotonic()
 
     # Redmine search ----------------------------------------------------
     def _fetch_issues(self, query: str, *, status: Optional[str], limit: int) -> List[Any]:
@@ -153,45 +342,54 @@ class RedmineConnector:
 
     # similarity scoring ------------------------------------------------
     def _find_best_match(self, original: str, issues: List[Any]) -> Optional[Tuple[int, float, str]]:
-        scored: List[Tuple[int, float, str]] = []
-        for it in issues:
-            title = self._trim_after_colon(it.title)
-            desc = it.description or ""
-            score = max(
-                SequenceMatcher(None, original, title).ratio(),
-                SequenceMatcher(None, original, desc).ratio(),
-            )
-            scored.append((it.id, score, f"{self.config['redmine']['url']}/issues/{it.id}"))
-        logger.debug("Scores for query '%s': %s", original, scored)
-        return max(scored, key=lambda t: t[1], default=None)
+        """
+        Pick the issue whose trimmed title or description is most similar to
+        *original* by ``SequenceMatcher.ratio``; the earliest issue wins ties.
+
+        A full ratio is quadratic and descriptions can be kilobytes long, so
+        texts are scored in tiers, best-first by their O(1)
+        ``real_quick_ratio`` bound: the walk stops once that bound falls
+        below the best score so far, and a text only gets a full ratio if
+        its O(n) ``quick_ratio`` bound can still win. Both bounds are exact,
+        so the result is the same as scoring every text.
+        """
+        if not issues:
+            return None
+        q_len = len(original)
+        texts: List[Tuple[float, int, str]] = []
+        for idx, it in enumerate(issues):
+            for text in (self._trim_after_colon(it.title), it.description or ""):
+                total = q_len + len(text)
+                bound = 2.0 * min(q_len, len(text)) / total if total else 1.0
+                texts.append((bound, idx, text))
+        texts.sort(key=lambda t: (-t[0], t[1]))
+
+        best_idx, best_score = -1, -1.0
+        matcher = SequenceMatcher(None, original, "")
+        full_ratios = 0
+        for bound, idx, text in texts:
+            if bound < best_score:
+                break
+            if bound == best_score and idx > best_idx:
+                continue
+            matcher.set_seq2(text)
+            quick = matcher.quick_ratio()
+            if quick < best_score or (quick == best_score and idx > best_idx):
+                continue
+            score = matcher.ratio()
+            full_ratios += 1
+            if score > best_score or (score == best_score and idx < best_idx):
+                best_idx, best_score = idx, score
+
+        best = issues[best_idx]
+        logger.debug("Best match for query '%s': issue %s (score %.02f, %d/%d full ratios)",
+                     original, best.id, best_score, full_ratios, len(texts))
+        return best.id, best_score, f"{self.config['redmine']['url']}/issues/{best.id}"
 
     # text utilities ----------------------------------------------------
     def _normalize_for_search(self, reason: str) -> str:
         """Best‑effort clean‑up so we hit the important *words* only."""
-        # strip surrounding quotes
-        reason = reason.strip().lstrip("'\"").rstrip("'\"")
-
-        # 1) remove leading ISO timestamp
-        reason = re.sub(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9:.+-]+\s+", "", reason)
-
-        # 2) remove daemon / host identifiers (osd.12, mon.foo123, mds.a, mgr.x)
-        # also remove any (){}[] around them
-        reason = re.sub(r"\b(?:osd|mon|mgr|mds)\.[A-Za-z0-9_-]+\b", "", reason)
-        reason = re.sub(r"[(){}]", "", reason)
-        logger.debug("Reason after removing daemon IDs: %s", reason)
-
-        # 3) remove bracketed log level tags like [WRN] [ERR] …
-        #reason = re.sub(r"\[[A-Z]{3}\]", "", reason)
-
-        # 4) scrub *all* standalone numbers (int or float) – usually not helpful
-        #reason = re.sub(r"\b\d+(?:\.\d+)?\b", "", reason)
-
-        # 5) zap stray punctuation that only creates tokens (parentheses, colons)
-        reason = re.sub(r"[()@:;\\\[\\]]", " ", reason)
-
-        # 6) collapse whitespace
-        reason = re.sub(r"\s+", " ", reason).strip()
-
+        reason = normalize_for_search(reason)
         logger.debug("Normalized reason: %s", reason)
         return reason
 
@@ -213,3 +411,4 @@ if __name__ == "__main__":
         "override osd_mclock_max_capacity_iops_[hdd|ssd]."
     )
     print(conn.search_and_refine(sample))
+    conn.flush()